@@ -0,0 +1,27 @@
+###########################################################################################
+#   Drop-in replacement of RawDatafromPaper.py reading the results from columnar archives
+#
+#   The archives are created from RawDatafromPaper.py the first time this module is
+#   imported, later imports only memory-map them.
+#
+###########################################################################################
+
+import os
+import sys
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(here))
+
+from tools.Archive_tools import convert_results_to_archive, ArchivedResults
+
+archive_bare = os.path.join(here, 'archives', 'raw_results_bare')
+archive_encoded = os.path.join(here, 'archives', 'raw_results_encoded')
+
+if not all(os.path.exists(os.path.join(archive, name)) for archive in [archive_bare, archive_encoded]
+           for name in ['qasms.json', 'jobs.json']):
+    import RawDatafromPaper
+    convert_results_to_archive(RawDatafromPaper.raw_results_bare, archive_bare)
+    convert_results_to_archive(RawDatafromPaper.raw_results_encoded, archive_encoded)
+
+raw_results_bare = ArchivedResults(archive_bare)
+raw_results_encoded = ArchivedResults(archive_encoded)
@@ -6,230 +6,587 @@
 #
 ###########################################################################################
 
+import re
 import random
+import itertools
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
 import numpy as np
 import matplotlib.pyplot as plt
 from scipy.stats import t, norm
 
-# Function that create all the qasm codes and misc information about the circuits to be run
-def create_all_circuits(cp):
-    
-    # The circuits for the experiment with input state and output distribution
-    circuits = [[['X1', 'HHS', 'CZ', 'X2'], '|00>', [0.25, 0.25, 0.25, 0.25]],
-                [['HHS', 'Z1', 'CZ'], '|00>', [0.25, 0.25, 0.25, 0.25]],
-                [['HHS', 'Z1', 'Z2'], '|00>', [0.25, 0.25, 0.25, 0.25]],
-                [['HHS', 'Z2', 'CZ'], '|00>', [0.25, 0.25, 0.25, 0.25]],
-                [['Z2', 'X2'], '|00>+|11>', [0, .5, .5, 0]],
-                [['X1', 'Z2'], '|0+>', [0, 0, .5, .5]],
-                [['HHS', 'Z1'], '|00>', [0.25, 0.25, 0.25, 0.25]],
-                [['HHS', 'CZ'], '|00>', [0.25, 0.25, 0.25, 0.25]],
-                [['X1', 'X2'], '|00>', [0, 0, 0, 1]],
-                [['HHS', 'Z2'], '|00>', [0.25, 0.25, 0.25, 0.25]],
-                [['X1'], '|00>+|11>', [0, .5, .5, 0]],
-                [['X1'], '|0+>', [0, 0, .5, .5]],
-                [['HHS'], '|00>', [0.25, 0.25, 0.25, 0.25]],
-                [['Z2'], '|00>+|11>', [.5, 0, 0, .5]],
-                [['Z2'], '|0+>', [.5, .5, 0, 0]],
-                [['X1'], '|00>', [0, 0, 1, 0]],
-                [['X2'], '|00>', [0, 1, 0, 0]],
-                [[], '|00>+|11>', [.5, 0, 0, .5]],
-                [[], '|0+>', [.5, .5, 0, 0]],
-                [[], '|00>', [1, 0, 0, 0]]]
-
-    # Definition of the possible gates to perform and their possible qasm implementations
-    gates = ['X1','X2','Z1','Z2','HHS','CZ']
-
-    # Count of 1- and 2-qubit physical gates
-    gate_count_bare_1q = [1,1,1,1,2,2]
-    gate_count_bare_2q = [0,0,0,0,0,1]
-
-    gate_count_encoded_1q = [2,2,2,2,4,4]
-    gate_count_encoded_2q = [0,0,0,0,0,0]
-
-    # Doing the SWAP in software require swapping X1<->X2 and Z1<->Z2 depending on how many SWAPs have been done before
-    indices = [[0,1,2,3,4,5],[1,0,3,2,4,5]];
-
-    # QASM code for the gates in their bare version
-    gates_qasm = [['x q['+str(cp[0])+'];\n'],
-                  ['x q['+str(cp[1])+'];\n'],
-                  ['z q['+str(cp[0])+'];\n'],
-                  ['z q['+str(cp[1])+'];\n'],
-                  ['h q['+str(cp[0])+'];\nh q['+str(cp[1])+'];\n'],
-                  ['h q['+str(cp[1])+'];\ncx q['+str(cp[0])+'], q['+str(cp[1])+'];\nh q['+str(cp[1])+'];\n']]
-
-    # QASM code for the gates in their encoded version
-    gates_qasm_encoded = [['x q[1];\nx q[4];\n','x q[2];\nx q[3];\n'],
-                          ['x q[1];\nx q[3];\n','x q[2];\nx q[4];\n'],
-                          ['z q[1];\nz q[3];\n','z q[2];\nz q[4];\n'],
-                          ['z q[1];\nz q[4];\n','z q[2];\nz q[3];\n'],
-                          ['h q[1];\nh q[2];\nh q[3];\nh q[4];\n'],
-                          ['s q[1];\ns q[2];\ns q[3];\ns q[4];\n']]
-
-    #names of input states
-    state_names = ['|00>','|0+>','|00>+|11>']
+# Intermediate representation (IR) of the circuits
+# A circuit is a dictionary holding the number of qubits and bits, three arrays of the same length:
+#   'op' : opcode of each statement, index in ir_opcodes
+#   'q0' : first qubit of the gate, measured qubit, or start of the qubits of a barrier in 'barrier_qubits'
+#   'q1' : target qubit of a cx, bit of a measurement, end of the qubits of a barrier in 'barrier_qubits', -1 otherwise
+# and the array 'barrier_qubits' of the qubits of all the barriers one after the other, so barriers can act on any number of qubits
+ir_opcodes = ['x','z','h','s','cx','barrier','measure']
+
+# Statement of a barrier on the given qubits
+def barrier(*qubits):
+    return ('barrier', tuple(qubits), -1)
+
+# Function building the IR of a circuit from a list of statements (name, q0, q1), q0 being the tuple of qubits of a barrier
+def circuit_ir(statements, n_qubits=5, n_bits=5):
+
+    op = np.array([ir_opcodes.index(st[0]) for st in statements], dtype=np.int8)
+    operands = []
+    barrier_qubits = []
+    for st in statements:
+        if st[0] == 'barrier':
+            operands.append((len(barrier_qubits), len(barrier_qubits)+len(st[1])))
+            barrier_qubits.extend(st[1])
+        else:
+            operands.append(st[1:])
+    operands = np.array(operands, dtype=np.int64).reshape(-1,2)
+    return {'n_qubits':n_qubits, 'n_bits':n_bits, 'op':op, 'q0':operands[:,0], 'q1':operands[:,1],
+            'barrier_qubits':np.array(barrier_qubits, dtype=np.int64)}
+
+# Key identifying a circuit given by its IR, two circuits with the same key have the same QASM code
+def ir_key(ir):
+    return (ir['n_qubits'], ir['n_bits'], ir['op'].tobytes(), ir['q0'].tobytes(), ir['q1'].tobytes(),
+            ir['barrier_qubits'].tobytes())
+
+# Function rendering the QASM code of a circuit given by its IR
+def render_qasm(ir):
+
+    lines = ['OPENQASM 2.0;', 'include "qelib1.inc";', 'qreg q['+str(ir['n_qubits'])+'];', 'creg c['+str(ir['n_bits'])+'];']
+    for op, q0, q1 in zip(ir['op'].tolist(), ir['q0'].tolist(), ir['q1'].tolist()):
+        name = ir_opcodes[op]
+        if name == 'cx':
+            lines.append('cx q['+str(q0)+'],q['+str(q1)+'];')
+        elif name == 'barrier':
+            lines.append('barrier '+','.join('q['+str(q)+']' for q in ir['barrier_qubits'][q0:q1].tolist())+';')
+        elif name == 'measure':
+            lines.append('measure q['+str(q0)+'] -> c['+str(q1)+'];')
+        else:
+            lines.append(name+' q['+str(q0)+'];')
+    return '\n'.join(lines)+'\n'
+
+# One statement of the subset of OPENQASM 2.0 used in the experiment
+qasm_statement = re.compile(r"""\s*(?:
+      OPENQASM\s+[\d.]+
+    | include\s+"[^"]*"
+    | (?P<reg>qreg|creg)\s+\w+\[(?P<size>\d+)\]
+    | (?P<gate>[xzhs])\s+\w+\[(?P<qubit>\d+)\]
+    | cx\s+\w+\[(?P<control>\d+)\]\s*,\s*\w+\[(?P<target>\d+)\]
+    | barrier\s+(?P<barrier>[^;]*)
+    | measure\s+\w+\[(?P<measured>\d+)\]\s*->\s*\w+\[(?P<bit>\d+)\]
+    )\s*;""", re.VERBOSE)
+
+# Function parsing a qasm code, e.g. the 'qasm' field of an archived job, into the IR in a single pass
+# The same programs come back in every job so the results are memoized, their arrays are read-only
+@lru_cache(maxsize=4096)
+def qasm_to_ir(qasm):
+
+    qasm = re.sub(r'//[^\n]*', '', qasm)
+    n_qubits = 0
+    n_bits = 0
+    statements = []
+    position = 0
+
+    for m in qasm_statement.finditer(qasm):
+        if qasm[position:m.start()].strip() != '':
+            break
+        position = m.end()
+        if m.group('reg') == 'qreg':
+            n_qubits += int(m.group('size'))
+        elif m.group('reg') == 'creg':
+            n_bits += int(m.group('size'))
+        elif m.group('gate') is not None:
+            statements.append((m.group('gate'), int(m.group('qubit')), -1))
+        elif m.group('control') is not None:
+            statements.append(('cx', int(m.group('control')), int(m.group('target'))))
+        elif m.group('barrier') is not None:
+            statements.append(barrier(*[int(q) for q in re.findall(r'\[(\d+)\]', m.group('barrier'))]))
+        elif m.group('measured') is not None:
+            statements.append(('measure', int(m.group('measured')), int(m.group('bit'))))
+
+    if qasm[position:].strip() != '':
+        raise ValueError('Unsupported qasm statement : '+qasm[position:].strip().split(';')[0])
+
+    ir = circuit_ir(statements, n_qubits, n_bits)
+    for key in ['op', 'q0', 'q1', 'barrier_qubits']:
+        ir[key].flags.writeable = False
+    return ir
+
+# Function computing from the IR of a circuit the number of single- and two-qubit gates,
+# the depth (number of layers of gates, barriers aligning their qubits) and the number of gates acting on each qubit
+def circuit_statistics(ir):
+
+    op, q0, q1 = ir['op'], ir['q0'], ir['q1']
+    single = op < ir_opcodes.index('cx')
+    double = op == ir_opcodes.index('cx')
+
+    qubit_load = (np.bincount(q0[single | double], minlength=ir['n_qubits'])
+                  + np.bincount(q1[double], minlength=ir['n_qubits']))
+
+    level = np.zeros(ir['n_qubits'], dtype=np.int64)
+    for name, a, b in zip(op.tolist(), q0.tolist(), q1.tolist()):
+        if name < ir_opcodes.index('cx'):
+            level[a] += 1
+        elif name == ir_opcodes.index('cx'):
+            level[a] = level[b] = max(level[a], level[b]) + 1
+        elif name == ir_opcodes.index('barrier'):
+            qubits = ir['barrier_qubits'][a:b]
+            if len(qubits) > 0:
+                level[qubits] = level[qubits].max()
+
+    return {'gate_count':(int(single.sum()), int(double.sum())),
+            'depth':int(level.max()) if ir['n_qubits'] > 0 else 0,
+            'qubit_load':qubit_load}
+
+# Definition of the possible gates to perform, in the order of the implementations given by circuit_parts
+gates = ['X1','X2','Z1','Z2','HHS','CZ']
+
+# Doing the SWAP in software require swapping X1<->X2 and Z1<->Z2 depending on how many SWAPs have been done before
+indices = [[0,1,2,3,4,5],[1,0,3,2,4,5]]
+
+#names of input states
+state_names = ['|00>','|0+>','|00>+|11>']
+
+# Function giving the statements of the possible implementations of the gates
+# and of the pre- and post- circuits, in their bare version on the pair of qubits cp and in their encoded version
+def circuit_parts(cp):
+
+    # Statements of the gates in their bare version
+    gates_ir = [[[('x',cp[0],-1)]],
+                [[('x',cp[1],-1)]],
+                [[('z',cp[0],-1)]],
+                [[('z',cp[1],-1)]],
+                [[('h',cp[0],-1),('h',cp[1],-1)]],
+                [[('h',cp[1],-1),('cx',cp[0],cp[1]),('h',cp[1],-1)]]]
+
+    # Statements of the gates in their encoded version
+    gates_ir_encoded = [[[('x',1,-1),('x',4,-1)],[('x',2,-1),('x',3,-1)]],
+                        [[('x',1,-1),('x',3,-1)],[('x',2,-1),('x',4,-1)]],
+                        [[('z',1,-1),('z',3,-1)],[('z',2,-1),('z',4,-1)]],
+                        [[('z',1,-1),('z',4,-1)],[('z',2,-1),('z',3,-1)]],
+                        [[('h',1,-1),('h',2,-1),('h',3,-1),('h',4,-1)]],
+                        [[('s',1,-1),('s',2,-1),('s',3,-1),('s',4,-1)]]]
 
     # Definition of the pre- and post- circuits
-    code_heading = """
-OPENQASM 2.0;
-include "qelib1.inc";
-qreg q[5];
-creg c[5];
-"""
-
-    bare_pre_circuit = ["","",""]
-    bare_pre_circuit_count_1q = [0,1,1]
-    bare_pre_circuit_count_2q = [0,0,1]
-    
-    bare_pre_circuit[1] = """
-h q["""+str(cp[1])+"""];
-barrier q["""+str(cp[0])+"""],q["""+str(cp[1])+"""];
-"""
-    
-    bare_pre_circuit[2] = """
-h q["""+str(cp[0])+"""];
-cx q["""+str(cp[0])+"""], q["""+str(cp[1])+"""];
-barrier q["""+str(cp[0])+"""],q["""+str(cp[1])+"""];
-"""
-    
-    bare_post_circuit = """
-measure q["""+str(cp[0])+"""] -> c["""+str(cp[0])+"""];
-measure q["""+str(cp[1])+"""] -> c["""+str(cp[1])+"""];
-"""
-    
-    encoded_pre_circuit = ["","",""]
-    encoded_pre_circuit_count_1q = [11,6,2]
-    encoded_pre_circuit_count_2q = [8,5,2]
-    
-    encoded_pre_circuit[0] = """
-h q[3];
-cx q[3],q[4];
-cx q[4],q[2];
-cx q[1],q[2];
-h q[1];
-h q[2];
-cx q[1],q[2];
-h q[1];
-h q[2];
-cx q[1],q[2];
-cx q[3],q[2];
-h q[0];
-h q[1];
-h q[2];
-cx q[0],q[1];
-cx q[0],q[2];
-h q[0];
-h q[1];
-h q[2];
-barrier q[0],q[1],q[2],q[3],q[4];
-"""
-    
-    encoded_pre_circuit[1] = """
-h q[3];
-cx q[3],q[2];
-cx q[1],q[2];
-h q[1];
-h q[2];
-cx q[1],q[2];
-h q[1];
-h q[2];
-cx q[1],q[2];
-h q[4];
-cx q[4],q[2];
-barrier q[0],q[1],q[2],q[3],q[4];
-"""
-    
-    encoded_pre_circuit[2] = """
-h q[3];
-cx q[3],q[4];
-h q[1];
-cx q[1],q[2];
-barrier q[0],q[1],q[2],q[3],q[4];
-"""
+    bare_pre_circuit = [[],[],[]]
+    
+    bare_pre_circuit[1] = [('h',cp[1],-1),
+                           barrier(cp[0],cp[1])]
+    
+    bare_pre_circuit[2] = [('h',cp[0],-1),
+                           ('cx',cp[0],cp[1]),
+                           barrier(cp[0],cp[1])]
+    
+    bare_post_circuit = [('measure',cp[0],cp[0]),
+                         ('measure',cp[1],cp[1])]
+    
+    encoded_pre_circuit = [[],[],[]]
+    
+    encoded_pre_circuit[0] = [('h',3,-1),
+                              ('cx',3,4),
+                              ('cx',4,2),
+                              ('cx',1,2),
+                              ('h',1,-1),
+                              ('h',2,-1),
+                              ('cx',1,2),
+                              ('h',1,-1),
+                              ('h',2,-1),
+                              ('cx',1,2),
+                              ('cx',3,2),
+                              ('h',0,-1),
+                              ('h',1,-1),
+                              ('h',2,-1),
+                              ('cx',0,1),
+                              ('cx',0,2),
+                              ('h',0,-1),
+                              ('h',1,-1),
+                              ('h',2,-1),
+                              barrier(0,1,2,3,4)]
+    
+    encoded_pre_circuit[1] = [('h',3,-1),
+                              ('cx',3,2),
+                              ('cx',1,2),
+                              ('h',1,-1),
+                              ('h',2,-1),
+                              ('cx',1,2),
+                              ('h',1,-1),
+                              ('h',2,-1),
+                              ('cx',1,2),
+                              ('h',4,-1),
+                              ('cx',4,2),
+                              barrier(0,1,2,3,4)]
+    
+    encoded_pre_circuit[2] = [('h',3,-1),
+                              ('cx',3,4),
+                              ('h',1,-1),
+                              ('cx',1,2),
+                              barrier(0,1,2,3,4)]
    
-    encoded_post_circuit = """
-measure q[0] -> c[0];
-measure q[1] -> c[1];
-measure q[2] -> c[2];
-measure q[3] -> c[3];
-measure q[4] -> c[4];
-"""
+    encoded_post_circuit = [('measure',q,q) for q in range(0,5)]
+    
+    return {'gates_ir':gates_ir,
+            'gates_ir_encoded':gates_ir_encoded,
+            'bare_pre_circuit':bare_pre_circuit,
+            'bare_post_circuit':bare_post_circuit,
+            'encoded_pre_circuit':encoded_pre_circuit,
+            'encoded_post_circuit':encoded_post_circuit}
+
+# Function building the IR of one version ('bare' or 'encoded') of a circuit from its statements, its QASM code rendered from the IR,
+# together with its gate counts, depth and load of each qubit computed from the circuit itself
+def circuit_version_fields(statements, version):
+    
+    ir = circuit_ir(statements)
+    stats = circuit_statistics(ir)
+    return {'qasm_'+version:render_qasm(ir),
+            'ir_'+version:ir,
+            'gate_count_'+version:stats['gate_count'],
+            'depth_'+version:stats['depth'],
+            'qubit_load_'+version:stats['qubit_load']}
+
+# Function assembling the record of one circuit from the statements of its bare and encoded versions
+# The encoded version can also be given by the fields already built by circuit_version_fields, to share them between records
+# variant is the index of the implementation chosen for each gate of the encoded version, see sequence_statements
+def circuit_record(circuit_desc, statements_bare, statements_encoded, nH, input_state, output_distribution, variant=None):
+    
+    record = {'circuit_desc':circuit_desc,
+              'nH':nH,
+              'input_state':input_state,
+              'output_distribution':output_distribution,
+              'variant':variant}
+    record.update(circuit_version_fields(statements_bare, 'bare'))
+    if isinstance(statements_encoded, dict):
+        record.update(statements_encoded)
+    else:
+        record.update(circuit_version_fields(statements_encoded, 'encoded'))
+    return record
+
+# Function giving the statements of the bare ('bare') or encoded ('encoded') version of a sequence of gates applied to an input state,
+# with parts given by circuit_parts
+# variant gives the index of the implementation of each gate among the possible ones,
+# when it is None they are chosen at random with rng (the random module or a seeded random.Random)
+# Returns the statements, the parity of the number of software SWAPs and the variant
+def sequence_statements(parts, sequence, input_state, version, variant=None, rng=random):
+    
+    s = state_names.index(input_state)
+    implementations = parts['gates_ir'] if version=='bare' else parts['gates_ir_encoded']
+    statements = list(parts[version+'_pre_circuit'][s])
+    idx = 0
+    chosen = []
+    for j, g in enumerate(sequence):
+        k = gates.index(g)
+        if g=='HHS':
+            idx = (idx + 1) % 2
+        if version=='bare':
+            k = indices[idx][k]
+        l = len(implementations[k])
+        chosen.append(rng.randrange(0,l) if variant is None else variant[j])
+        statements += implementations[k][chosen[-1]]
+    return statements + parts[version+'_post_circuit'], idx, tuple(chosen)
+
+# Function giving all the variants of the encoded version of a sequence of gates,
+# i.e. all the combinations of the indices of the possible implementations of each gate
+def sequence_variants(sequence):
+    
+    n_implementations = [len(circuit_parts(possible_pairs[0])['gates_ir_encoded'][gates.index(g)]) for g in sequence]
+    return list(itertools.product(*[range(0,l) for l in n_implementations]))
+
+# The circuits for the experiment with their input state, the ideal output distributions
+# being computed by ideal_output_distribution
+experiment_circuits = [[['X1', 'HHS', 'CZ', 'X2'], '|00>'],
+                       [['HHS', 'Z1', 'CZ'], '|00>'],
+                       [['HHS', 'Z1', 'Z2'], '|00>'],
+                       [['HHS', 'Z2', 'CZ'], '|00>'],
+                       [['Z2', 'X2'], '|00>+|11>'],
+                       [['X1', 'Z2'], '|0+>'],
+                       [['HHS', 'Z1'], '|00>'],
+                       [['HHS', 'CZ'], '|00>'],
+                       [['X1', 'X2'], '|00>'],
+                       [['HHS', 'Z2'], '|00>'],
+                       [['X1'], '|00>+|11>'],
+                       [['X1'], '|0+>'],
+                       [['HHS'], '|00>'],
+                       [['Z2'], '|00>+|11>'],
+                       [['Z2'], '|0+>'],
+                       [['X1'], '|00>'],
+                       [['X2'], '|00>'],
+                       [[], '|00>+|11>'],
+                       [[], '|0+>'],
+                       [[], '|00>']]
+
+# Pairs of qubits of the chip on which the bare version can be run
+possible_pairs = [[0,1],[0,2],[1,2],[3,2],[3,4],[4,2]]
+
+# Function that create all the circuits, in IR and qasm code, and misc information about the circuits to be run
+# The implementations of the encoded gates are chosen at random, with a random.Random(seed) if a seed is given
+def create_all_circuits(cp, seed=None):
+    
+    parts = circuit_parts(cp)
+    rng = random if seed is None else random.Random(seed)
     
     #For each circuit, concatenating the state preparation code, the circuit code and the measurment code
     #Adding some misc information about the circuits on the way.
     circuit_list = []
     
-    for c in circuits:
-        idx = 0
-        qasm_bare = code_heading + bare_pre_circuit[state_names.index(c[1])]
-        qasm_encoded = code_heading + encoded_pre_circuit[state_names.index(c[1])]
-        circuit_gate_count_bare_1q = bare_pre_circuit_count_1q[state_names.index(c[1])]
-        circuit_gate_count_bare_2q = bare_pre_circuit_count_2q[state_names.index(c[1])]
-        circuit_gate_count_encoded_1q = encoded_pre_circuit_count_1q[state_names.index(c[1])]
-        circuit_gate_count_encoded_2q = encoded_pre_circuit_count_2q[state_names.index(c[1])]
-        for g in c[0]:
-            k = gates.index(g)
-            if g=='HHS':
-                idx = (idx + 1) % 2
-            l = len(gates_qasm[k])
-            qasm_bare += gates_qasm[indices[idx][k]][random.randrange(0,l)]
-            l = len(gates_qasm_encoded[k])
-            qasm_encoded += gates_qasm_encoded[k][random.randrange(0,l)]
-            circuit_gate_count_bare_1q += gate_count_bare_1q[k]
-            circuit_gate_count_bare_2q += gate_count_bare_2q[k]
-            circuit_gate_count_encoded_1q += gate_count_encoded_1q[k]
-            circuit_gate_count_encoded_2q += gate_count_encoded_2q[k]
+    for c in experiment_circuits:
+        statements_bare, idx, _ = sequence_statements(parts, c[0], c[1], 'bare', rng=rng)
+        statements_encoded, _, variant = sequence_statements(parts, c[0], c[1], 'encoded', rng=rng)
+        circuit_list.append(circuit_record(" ".join(c[0]), statements_bare, statements_encoded,
+                                           idx, c[1], list(ideal_output_distribution(tuple(c[0]), c[1])), variant))
+    return circuit_list
+
+# Memoized results of create_circuits_all_pairs, indexed by the pairs and the seed
+circuits_all_pairs_cache = {}
+
+# Function making the arrays of the fields of a record read-only, so that records can share them safely
+def freeze_fields(fields):
+    
+    for value in fields.values():
+        if isinstance(value, dict):
+            freeze_fields(value)
+        elif isinstance(value, np.ndarray):
+            value.flags.writeable = False
+    return fields
+
+# Function giving a copy of a record of create_circuits_all_pairs, the read-only arrays being shared
+def copy_record(record):
+    return {key:dict(value) if isinstance(value, dict) else value for key, value in record.items()}
+
+# Function that create all the circuits for all the pairs of qubits at once, returned as {pair (tuple):list of circuits}
+# The encoded version does not depend on the pair, its IR and statistics are built once and shared by the records of all pairs,
+# their arrays being read-only
+# The implementations of the encoded gates are chosen with a random.Random(seed), and the circuits of a given seed are memoized,
+# e.g. for when the pair changes from one job to the next; every call returns new records
+# Without a seed they are chosen at random and the circuits are built again at each call, as with create_all_circuits
+def create_circuits_all_pairs(pairs=possible_pairs, seed=None):
+    
+    key = (tuple(tuple(cp) for cp in pairs), seed)
+    if key in circuits_all_pairs_cache:
+        circuits_per_pair = circuits_all_pairs_cache[key]
+        return {cp:[copy_record(r) for r in circuit_list] for cp, circuit_list in circuits_per_pair.items()}
+    
+    rng = random if seed is None else random.Random(seed)
+    
+    # The encoded statements given by circuit_parts are the same for any pair
+    parts = circuit_parts(possible_pairs[0])
+    encoded_fields = []
+    for c in experiment_circuits:
+        statements_encoded, _, variant = sequence_statements(parts, c[0], c[1], 'encoded', rng=rng)
+        encoded_fields.append((freeze_fields(circuit_version_fields(statements_encoded, 'encoded')), variant))
+    
+    circuits_per_pair = {}
+    for cp in key[0]:
+        parts = circuit_parts(cp)
+        circuit_list = []
+        for c, (fields, variant) in zip(experiment_circuits, encoded_fields):
+            statements_bare, idx, _ = sequence_statements(parts, c[0], c[1], 'bare', rng=rng)
+            circuit_list.append(freeze_fields(circuit_record(" ".join(c[0]), statements_bare, fields, idx, c[1],
+                                                             list(ideal_output_distribution(tuple(c[0]), c[1])), variant)))
+        circuits_per_pair[cp] = circuit_list
+    
+    if seed is not None:
+        circuits_all_pairs_cache[key] = circuits_per_pair
+    return {cp:[copy_record(r) for r in circuit_list] for cp, circuit_list in circuits_per_pair.items()}
+
+# Function that create the circuits for every variant of the encoded version of each circuit, or for n_samples variants
+# of each circuit drawn without replacement with a random.Random(seed), so the same seed always gives the same circuits
+# Each record holds its 'variant' and the index 'circuit_index' of its circuit in circuits, so the results can be grouped by variant
+# The bare and encoded programs are deduplicated separately: 'bare_index' and 'encoded_index' give the index of the program
+# of each version among the distinct programs of this version, in order of first appearance (see variant_batch)
+# Records whose bare and encoded programs are both identical to the ones of a previous record are skipped
+def create_all_variants(cp, n_samples=None, seed=None, circuits=experiment_circuits):
+    
+    parts = circuit_parts(cp)
+    rng = random.Random(seed)
+    circuit_list = []
+    seen = {'bare':{}, 'encoded':{}}
+    
+    for i, c in enumerate(circuits):
+        statements_bare, idx, _ = sequence_statements(parts, c[0], c[1], 'bare', rng=rng)
+        output_distribution = list(ideal_output_distribution(tuple(c[0]), c[1]))
+        variants = sequence_variants(c[0])
+        if n_samples is not None and n_samples < len(variants):
+            variants = sorted(rng.sample(variants, n_samples))
         
-        circuit_list.append({'circuit_desc':" ".join(c[0]),
-                             'qasm_bare':qasm_bare + bare_post_circuit,
-                             'qasm_encoded':qasm_encoded + encoded_post_circuit,
-                             'nH':idx,
-                             'gate_count_bare':(circuit_gate_count_bare_1q,circuit_gate_count_bare_2q),
-                             'gate_count_encoded':(circuit_gate_count_encoded_1q,circuit_gate_count_encoded_2q),
-                             'input_state':c[1],
-                             'output_distribution':c[2]})
+        for variant in variants:
+            statements_encoded, _, _ = sequence_statements(parts, c[0], c[1], 'encoded', variant)
+            record = circuit_record(" ".join(c[0]), statements_bare, statements_encoded,
+                                    idx, c[1], output_distribution, variant)
+            keys = {version:ir_key(record['ir_'+version]) for version in seen}
+            if all(keys[version] in seen[version] for version in seen):
+                continue
+            for version in seen:
+                record[version+'_index'] = seen[version].setdefault(keys[version], len(seen[version]))
+            record['circuit_index'] = i
+            circuit_list.append(record)
+    
     return circuit_list
 
-# Function that analyse one run (8192 shots) of one circuit in its bare version
-def analysis_one_bare_expe(expe_bare, circuit, cpp):
+# Function giving the batch of the distinct programs of one version ('bare' or 'encoded') of the records made by create_all_variants,
+# the program of index k being the one of the records whose 'bare_index' or 'encoded_index' is k
+def variant_batch(circuit_list, version):
+    
+    batch = {}
+    for record in circuit_list:
+        batch.setdefault(record[version+'_index'], {'qasm':record['qasm_'+version]})
+    return [batch[k] for k in range(0, len(batch))]
+
+# Logical action of the gates on the two encoded qubits, the first qubit being the high bit of the labels '00','01','10','11'
+logical_gate_matrices = {'X1':np.kron([[0,1],[1,0]], np.eye(2)),
+                         'X2':np.kron(np.eye(2), [[0,1],[1,0]]),
+                         'Z1':np.kron([[1,0],[0,-1]], np.eye(2)),
+                         'Z2':np.kron(np.eye(2), [[1,0],[0,-1]]),
+                         'HHS':np.array([[1,0,0,0],[0,0,1,0],[0,1,0,0],[0,0,0,1]])
+                               @ np.kron([[1,1],[1,-1]], [[1,1],[1,-1]])/2,
+                         'CZ':np.diag([1.,1.,1.,-1.])}
+
+# The transversal S of the encoded CZ implements CZ up to a logical Z1 Z2
+logical_gate_matrices_encoded = dict(logical_gate_matrices, CZ=np.diag([1.,-1.,-1.,-1.]))
+
+# Logical input states
+logical_input_states = {'|00>':np.array([1.,0,0,0]),
+                        '|0+>':np.array([1.,1,0,0])/np.sqrt(2),
+                        '|00>+|11>':np.array([1.,0,0,1])/np.sqrt(2)}
+
+# Key identifying a logical operator up to a global phase
+def logical_operator_key(operator):
+    
+    pivot = operator.flat[np.argmax(np.abs(operator) > 1e-9)]
+    return np.round(operator*abs(pivot)/pivot, 9).tobytes()
+
+# Function giving the logical operator implemented by a sequence of gates (tuple of names), in its bare or encoded version
+# The operators are memoized and computed from the one of the sequence without its last gate,
+# so the prefixes shared by many sequences are only multiplied once
+@lru_cache(maxsize=65536)
+def logical_operator(sequence, encoded=False):
+    
+    if len(sequence) == 0:
+        operator = np.eye(4)
+    else:
+        matrices = logical_gate_matrices_encoded if encoded else logical_gate_matrices
+        operator = matrices[sequence[-1]] @ logical_operator(sequence[:-1], encoded)
+    operator.flags.writeable = False
+    return operator
+
+# Function computing the ideal output distribution over the labels '00','01','10','11'
+# of a sequence of gates (tuple of names) applied to an input state, memoized by (sequence, input state)
+@lru_cache(maxsize=65536)
+def ideal_output_distribution(sequence, input_state, encoded=False):
+    
+    amplitudes = logical_operator(sequence, encoded) @ logical_input_states[input_state]
+    return tuple(float(p) for p in np.round(np.abs(amplitudes)**2, 12))
+
+# Function generating all the circuits made of up to max_length gates among gate_set, for each of the input states,
+# in the same format as create_all_circuits
+# Only the circuits whose bare and encoded versions have the same ideal output distribution are kept
+# Gate sequences implementing the same logical operators (up to a phase) as a shorter or earlier one are skipped when dedupe is True,
+# their extensions being then skipped as well
+# Sequences are extended one gate at a time, so the logical operators and the statements of each prefix are computed only once
+# The implementations of the encoded gates are chosen at random, with a random.Random(seed) if a seed is given
+def generate_circuit_family(cp, max_length, input_states=state_names, gate_set=gates, dedupe=True, seed=None):
+    
+    parts = circuit_parts(cp)
+    rng = random if seed is None else random.Random(seed)
+    circuit_list = []
+    
+    for input_state in input_states:
+        s = state_names.index(input_state)
+        seen = set()
+        layer = [((), 0, list(parts['bare_pre_circuit'][s]), list(parts['encoded_pre_circuit'][s]))]
+        
+        for length in range(0, max_length+1):
+            next_layer = []
+            for sequence, idx, statements_bare, statements_encoded in layer:
+                if dedupe:
+                    key = (logical_operator_key(logical_operator(sequence)),
+                           logical_operator_key(logical_operator(sequence, True)))
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                
+                output_distribution = ideal_output_distribution(sequence, input_state)
+                if np.allclose(output_distribution, ideal_output_distribution(sequence, input_state, True)):
+                    circuit_list.append(circuit_record(" ".join(sequence),
+                                                       statements_bare + parts['bare_post_circuit'],
+                                                       statements_encoded + parts['encoded_post_circuit'],
+                                                       idx, input_state, list(output_distribution)))
+                
+                if length == max_length:
+                    continue
+                for g in gate_set:
+                    k = gates.index(g)
+                    next_idx = (idx + 1) % 2 if g=='HHS' else idx
+                    l = len(parts['gates_ir'][k])
+                    next_bare = statements_bare + parts['gates_ir'][indices[next_idx][k]][rng.randrange(0,l)]
+                    l = len(parts['gates_ir_encoded'][k])
+                    next_encoded = statements_encoded + parts['gates_ir_encoded'][k][rng.randrange(0,l)]
+                    next_layer.append((sequence + (g,), next_idx, next_bare, next_encoded))
+            layer = next_layer
+    
+    return circuit_list
+
+# Function converting the counts of one run into an array of 32 entries indexed by the 5-bit outcome read as an integer
+def counts_vector(counts):
+    
+    vector = np.zeros(32, dtype=np.int64)
+    for label, n in counts.items():
+        vector[int(label,2)] += n
+    return vector
+
+# Lookup tables sending each 5-bit outcome to its logical label (0,1,2,3 for '00','01','10','11')
+# or to 4 when an error has been detected
+# For the bare version the table depends on the pair of qubits and on the parity of the number of software SWAPs
+@lru_cache(maxsize=None)
+def bare_lookup_table(cpp, nH):
+    
+    table = np.full(32, 4, dtype=np.int64)
+    first, second = (cpp[0], cpp[1]) if nH==0 else (cpp[1], cpp[0])
+    for l in range(0,4):
+        table[((l >> 1) << first) | ((l & 1) << second)] = l
+    table.flags.writeable = False
+    return table
+
+# For the encoded version the two codewords of each logical label of the [[4,2,2]] code
+@lru_cache(maxsize=None)
+def encoded_lookup_table():
     
-    raw_labels_list = [['0','0','0','0','0'],['0','0','0','0','0'],['0','0','0','0','0'],['0','0','0','0','0']];
-    raw_labels_list[1][4-cpp[1]] = '1';
-    raw_labels_list[2][4-cpp[0]] = '1';
-    raw_labels_list[3][4-cpp[1]] = '1';
-    raw_labels_list[3][4-cpp[0]] = '1';
+    codewords = [['00000','11110'],['01010','10100'],['10010','01100'],['11000','00110']]
+    table = np.full(32, 4, dtype=np.int64)
+    for l, cws in enumerate(codewords):
+        for cw in cws:
+            table[int(cw,2)] = l
+    table.flags.writeable = False
+    return table
+
+# Function sorting the counts of one run into the logical labels using a lookup table
+def logical_counts(counts, table):
     
-    raw_labels = [''.join(rll) for rll in raw_labels_list];
+    binned = np.bincount(table, weights=counts_vector(counts), minlength=5)
+    return binned[0:4], int(binned[4])
+
+# Function computing the standard deviation of the statistical distance from the logical counts
+# values is an array of shape (..., 4), the result has shape (...)
+# With p the frequencies and N the number of valid shots the variance is
+#   sum_j p_j(1-p_j)/(4N) + sum_{i!=j} p_i p_j/(4N) = (sum_j p_j + (sum_j p_j)^2 - 2 sum_j p_j^2)/(4N)
+# which is (1 - sum_j p_j^2)/(2N) since the frequencies sum to one
+def compute_stat_dist_stand_dev(values):
     
-    data_bare = expe_bare['result']['data']['counts']
+    values = np.asarray(values, dtype=float)
+    total_valid = values.sum(axis=-1)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        freqs = values/total_valid[...,None]
+        s1 = freqs.sum(axis=-1)
+        s2 = (freqs**2).sum(axis=-1)
+        return np.sqrt((s1 + s1**2 - 2*s2)/(4*total_valid))
+
+# Function that analyse one run (8192 shots) of one circuit in its bare version
+def analysis_one_bare_expe(expe_bare, circuit, cpp):
     
     labels = ['00','01','10','11']
-    labels_bare = sorted(data_bare)
-    
-    values_bare = np.array([0,0,0,0],dtype=float)
-    total_valid_bare = 0
-    total_err_bare = 0
-    
-    for label in labels_bare:
-        if label==raw_labels[0]:
-            values_bare[0] += data_bare[label]
-            total_valid_bare += data_bare[label]
-        elif label==raw_labels[1]:
-            if circuit['nH']==0:
-                values_bare[1] += data_bare[label]
-            else:
-                values_bare[2] += data_bare[label]
-            total_valid_bare += data_bare[label]
-        elif label==raw_labels[2]:
-            if circuit['nH']==0:
-                values_bare[2] += data_bare[label]
-            else:
-                values_bare[1] += data_bare[label]
-            total_valid_bare += data_bare[label]
-        elif label==raw_labels[3]:
-            values_bare[3] += data_bare[label]
-            total_valid_bare += data_bare[label]
-        else:
-            total_err_bare += data_bare[label]
+    
+    values_bare, total_err_bare = logical_counts(expe_bare['result']['data']['counts'],
+                                                 bare_lookup_table(tuple(cpp), circuit['nH']))
+    total_valid_bare = int(values_bare.sum())
         
     values_expectation = np.array(circuit['output_distribution'])
     
@@ -239,15 +596,7 @@ def analysis_one_bare_expe(expe_bare, circuit, cpp):
     
     stat_dist_bare = .5*sum(np.abs(values_bare/total_valid_bare-values_expectation))
     
-    stat_dist_stand_dev = 0
-    for j in range(0,4):
-        stat_dist_stand_dev += values_bare[j]/total_valid_bare*(1-values_bare[j]/total_valid_bare)/(4*total_valid_bare)
-    for i in range(0,4):
-        for j in range(0,4):
-            if i!=j:
-                stat_dist_stand_dev += values_bare[i]/total_valid_bare*values_bare[j]/total_valid_bare/(4*total_valid_bare)
-
-    stat_dist_stand_dev = np.sqrt(stat_dist_stand_dev)
+    stat_dist_stand_dev = compute_stat_dist_stand_dev(values_bare)
     
     return {'circuit_desc':circuit['circuit_desc'],
             'version':'bare',
@@ -265,31 +614,12 @@ def analysis_one_bare_expe(expe_bare, circuit, cpp):
 
 # Function that analyse one run (8192 shots) of one circuit in its encoded version
 def analysis_one_encoded_expe(expe_encoded, circuit):
-
-    data_encoded = expe_encoded['result']['data']['counts']
     
     labels = ['00','01','10','11']
-    labels_encoded = sorted(data_encoded)
-    
-    values_encoded = np.array([0,0,0,0],dtype=float)
-    total_valid_encoded = 0
-    total_err_encoded = 0
-    
-    for label in labels_encoded:
-        if label=='00000' or label=='11110':
-            values_encoded[0] += data_encoded[label]
-            total_valid_encoded += data_encoded[label]
-        elif label=='01010' or label=='10100':
-            values_encoded[1] += data_encoded[label]
-            total_valid_encoded += data_encoded[label]
-        elif label=='10010' or label=='01100':
-            values_encoded[2] += data_encoded[label]
-            total_valid_encoded += data_encoded[label]
-        elif label=='11000' or label=='00110':
-            values_encoded[3] += data_encoded[label]
-            total_valid_encoded += data_encoded[label]
-        else:
-            total_err_encoded += data_encoded[label]
+    
+    values_encoded, total_err_encoded = logical_counts(expe_encoded['result']['data']['counts'],
+                                                       encoded_lookup_table())
+    total_valid_encoded = int(values_encoded.sum())
 
     values_expectation = np.array(circuit['output_distribution'])
     
@@ -299,15 +629,7 @@ def analysis_one_encoded_expe(expe_encoded, circuit):
 
     stat_dist_encoded = .5*sum(np.abs(values_encoded/total_valid_encoded-values_expectation))
 
-    stat_dist_stand_dev = 0
-    for j in range(0,4):
-        stat_dist_stand_dev += values_encoded[j]/total_valid_encoded*(1-values_encoded[j]/total_valid_encoded)/(4*total_valid_encoded)
-    for i in range(0,4):
-        for j in range(0,4):
-            if i!=j:
-                stat_dist_stand_dev += values_encoded[i]/total_valid_encoded*values_encoded[j]/total_valid_encoded/(4*total_valid_encoded)
-
-    stat_dist_stand_dev = np.sqrt(stat_dist_stand_dev)
+    stat_dist_stand_dev = compute_stat_dist_stand_dev(values_encoded)
     
     return {'circuit_desc':circuit['circuit_desc'],
             'version':'encoded',
@@ -323,6 +645,109 @@ def analysis_one_encoded_expe(expe_encoded, circuit):
             'stat_dist':stat_dist_encoded,
             'stat_dist_stand_dev':stat_dist_stand_dev}
 
+# Function that gathers the counts of all runs of all circuits into a (runs x circuits x 32) array
+# The last index is the 5-bit outcome label read as an integer, e.g. '00101' -> 5
+def counts_tensor(results_list, n_circuits=20):
+    
+    counts = np.zeros((len(results_list), n_circuits, 32), dtype=np.int64)
+    
+    for j, res in enumerate(results_list):
+        for k in range(0,n_circuits):
+            counts[j,k] = counts_vector(res['qasms'][k]['result']['data']['counts'])
+    return counts
+
+# Function computing the statistics of analysis_one_bare_expe and analysis_one_encoded_expe
+# for arrays of logical counts of shape (runs x circuits x 4)
+def statistics_all_expe(values, total_err, all_circuits, version):
+    
+    values = np.asarray(values, dtype=float)
+    total_valid = values.sum(axis=-1)
+    values_expectation = np.array([c['output_distribution'] for c in all_circuits], dtype=float)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        freqs = values/total_valid[...,None]
+        stand_dev = np.sqrt(freqs*(1-freqs)/total_valid[...,None])
+        post_selected_ratio = total_valid/(total_valid+total_err)
+        stat_dist = .5*np.abs(freqs-values_expectation).sum(axis=-1)
+    
+    return {'circuit_desc':[c['circuit_desc'] for c in all_circuits],
+            'version':version,
+            'gate_count':np.array([sum(c['gate_count_'+version]) for c in all_circuits]),
+            'input_state':[c['input_state'] for c in all_circuits],
+            'labels':['00','01','10','11'],
+            'values':values,
+            'total_valid':total_valid,
+            'total_err':total_err,
+            'output_distribution':values_expectation,
+            'stand_dev':stand_dev,
+            'post_selected_ratio':post_selected_ratio,
+            'stat_dist':stat_dist,
+            'stat_dist_stand_dev':compute_stat_dist_stand_dev(values)}
+
+# Function that analyse all runs of all circuits in their bare version at once
+# results_bare is either the list of jobs or the (runs x circuits x 32) array given by counts_tensor,
+# cpps is either one pair of qubits for all runs or one pair per run
+def analysis_all_bare_expe(results_bare, all_circuits, cpps):
+    
+    if isinstance(results_bare, np.ndarray):
+        counts = results_bare
+    else:
+        counts = counts_tensor(results_bare, len(all_circuits))
+    
+    n_runs = counts.shape[0]
+    cpps = np.broadcast_to(np.asarray(cpps, dtype=np.int64).reshape(-1,2), (n_runs,2))
+    
+    # The runs are grouped by pair of qubits and the circuits by parity of the number of software SWAPs,
+    # the lookup table of each group being turned into a projection onto the logical labels and the error bin
+    pairs, run_group = np.unique(cpps, axis=0, return_inverse=True)
+    run_group = run_group.reshape(-1)
+    nHs = np.array([c['nH'] for c in all_circuits])
+    binned = np.zeros(counts.shape[0:2]+(5,), dtype=np.int64)
+    for g, cpp in enumerate(pairs.tolist()):
+        runs = np.flatnonzero(run_group == g)
+        for nH in np.unique(nHs).tolist():
+            circuits = np.flatnonzero(nHs == nH)
+            projection = np.eye(5, dtype=np.int64)[bare_lookup_table(tuple(cpp), nH)]
+            binned[np.ix_(runs, circuits)] = counts[np.ix_(runs, circuits)] @ projection
+    values, total_err = binned[...,0:4], binned[...,4]
+    
+    return statistics_all_expe(values, total_err, all_circuits, 'bare')
+
+# Function that analyse all runs of all circuits in their encoded version at once
+# results_encoded is either the list of jobs or the (runs x circuits x 32) array given by counts_tensor
+def analysis_all_encoded_expe(results_encoded, all_circuits):
+    
+    if isinstance(results_encoded, np.ndarray):
+        counts = results_encoded
+    else:
+        counts = counts_tensor(results_encoded, len(all_circuits))
+    
+    binned = counts @ np.eye(5, dtype=np.int64)[encoded_lookup_table()]
+    values, total_err = binned[...,0:4], binned[...,4]
+    
+    return statistics_all_expe(values, total_err, all_circuits, 'encoded')
+
+# Function that splits the output of analysis_all_bare_expe or analysis_all_encoded_expe
+# into a list (runs) of lists (circuits) of the dictionaries given by analysis_one_bare_expe or analysis_one_encoded_expe
+def unpack_all_expe(analysed_all):
+    
+    n_runs, n_circuits = analysed_all['stat_dist'].shape
+    
+    return [[{'circuit_desc':analysed_all['circuit_desc'][k],
+              'version':analysed_all['version'],
+              'gate_count':analysed_all['gate_count'][k],
+              'input_state':analysed_all['input_state'][k],
+              'labels':analysed_all['labels'],
+              'values':analysed_all['values'][j,k],
+              'total_valid':analysed_all['total_valid'][j,k],
+              'total_err':analysed_all['total_err'][j,k],
+              'output_distribution':analysed_all['output_distribution'][k],
+              'stand_dev':analysed_all['stand_dev'][j,k],
+              'post_selected_ratio':analysed_all['post_selected_ratio'][j,k],
+              'stat_dist':analysed_all['stat_dist'][j,k],
+              'stat_dist_stand_dev':analysed_all['stat_dist_stand_dev'][j,k]}
+             for k in range(0,n_circuits)] for j in range(0,n_runs)]
+
 # Plotting one bare run next to one encoded run with the expected output distribution
 def plot_one_expe(analysed_data1,analysed_data2,confidence):
     N = 4;
@@ -346,55 +771,351 @@ def plot_one_expe(analysed_data1,analysed_data2,confidence):
     plt.show();
 
     
-# Function that analyse all the runs per circuit
+# Function giving the half-width of the t-based confidence interval of the mean over n_runs runs with standard deviation std_dev
+def t_conf_int(n_runs, std_dev, confidence):
+    
+    ct = t.interval(confidence, n_runs-1, loc=0, scale=1)[1]
+    return ct*std_dev/np.sqrt(n_runs)
+
+# Function computing for every circuit the mean, the standard deviation and the half-width of the t-based confidence interval
+# of the statistical distance over the runs, for the bare and encoded versions given as (runs x circuits) arrays,
+# e.g. the 'stat_dist' of analysis_all_bare_expe and analysis_all_encoded_expe
+# The two versions can have different numbers of runs, the results are arrays with one entry per circuit
+def stat_dist_all_expe(stat_dist_bare, stat_dist_encoded, confidence):
+    
+    statistics = {'confidence':confidence}
+    for version, stat_dist in [('bare', stat_dist_bare), ('encoded', stat_dist_encoded)]:
+        stat_dist = np.asarray(stat_dist, dtype=float)
+        std_dev = stat_dist.std(axis=0, ddof=1)
+        statistics[version+'_mean_stat_dist'] = stat_dist.mean(axis=0)
+        statistics[version+'_std_dev'] = std_dev
+        statistics[version+'_conf_int'] = t_conf_int(stat_dist.shape[0], std_dev, confidence)
+    return statistics
+
+# Function gathering the statistical distances and the description of the circuits from a list (runs) of lists (circuits)
+# of the dictionaries given by analysis_one_bare_expe or analysis_one_encoded_expe, in the format of analysis_all_bare_expe
+# The outputs of analysis_all_bare_expe and analysis_all_encoded_expe are returned unchanged
+def gather_stat_dist(listlist):
+    
+    if isinstance(listlist, dict):
+        return listlist
+    return {'stat_dist':np.array([[r['stat_dist'] for r in run] for run in listlist]),
+            'version':listlist[0][0]['version'],
+            'circuit_desc':[r['circuit_desc'] for r in listlist[0]],
+            'gate_count':[r['gate_count'] for r in listlist[0]],
+            'input_state':[r['input_state'] for r in listlist[0]],
+            'output_distribution':[r['output_distribution'] for r in listlist[0]]}
+
+# Function assembling the list (circuits) of the dictionaries given by analyse_all_expe
+# from the descriptions of the bare and encoded circuits and the statistics given by stat_dist_all_expe
+def all_expe_records(bare, encoded, statistics):
+    
+    return [{'circuit_desc':bare['circuit_desc'][k],
+             'gate_count_bare':bare['gate_count'][k],
+             'gate_count_encoded':encoded['gate_count'][k],
+             'input_state':bare['input_state'][k],
+             'output_distribution':bare['output_distribution'][k],
+             'bare_mean_stat_dist':statistics['bare_mean_stat_dist'][k],
+             'encoded_mean_stat_dist':statistics['encoded_mean_stat_dist'][k],
+             'bare_std_dev':statistics['bare_std_dev'][k],
+             'encoded_std_dev':statistics['encoded_std_dev'][k],
+             'bare_conf_int':statistics['bare_conf_int'][k],
+             'encoded_conf_int':statistics['encoded_conf_int'][k],
+             'confidence':statistics['confidence']}
+            for k in range(0, len(bare['circuit_desc']))]
+
+# Function that analyse all the runs per circuit, for any number of runs and circuits
+# The runs are given either as lists (runs) of lists (circuits) of the dictionaries given by analysis_one_bare_expe
+# and analysis_one_encoded_expe, or directly as the outputs of analysis_all_bare_expe and analysis_all_encoded_expe
 def analyse_all_expe(listlist_bare, listlist_encoded, confidence):
     
-    all_expe = []
+    bare = gather_stat_dist(listlist_bare)
+    encoded = gather_stat_dist(listlist_encoded)
     
-    for expe in range(0,20):
-        bare_runs = [e[expe] for e in listlist_bare]
-        encoded_runs = [e[expe] for e in listlist_encoded]
-        
-        bare_mean_stat_dist = 0
-        encoded_mean_stat_dist = 0
-        
-        bare_std_dev = 0
-        encoded_std_dev = 0
+    return all_expe_records(bare, encoded, stat_dist_all_expe(bare['stat_dist'], encoded['stat_dist'], confidence))
+
+# Running mean and variance of the statistical distance of every circuit for the bare and encoded versions,
+# updated with the Welford/Chan formulas so that new runs are absorbed without going through the previous ones again
+#   add(analysed)   absorbs runs given as in analyse_all_expe, e.g. the output of analysis_all_bare_expe for the new jobs
+#   merge(other)    absorbs the runs of another aggregator of the same circuits
+#   all_expe(conf)  gives the same list as analyse_all_expe on all the runs absorbed so far
+#   save(path)      stores the aggregator in a .npz file, read back with StatDistAggregator.load(path)
+class StatDistAggregator:
+    
+    versions = ['bare', 'encoded']
+    
+    def __init__(self):
+        self.circuits = None
+        self.n_runs = {v:0 for v in self.versions}
+        self.mean = {v:None for v in self.versions}
+        self.m2 = {v:None for v in self.versions}
+        self.gate_count = {v:None for v in self.versions}
+    
+    def init_circuits(self, circuits):
+        if self.circuits is None:
+            n_circuits = len(circuits['circuit_desc'])
+            self.circuits = {'circuit_desc':list(circuits['circuit_desc']),
+                             'input_state':list(circuits['input_state']),
+                             'output_distribution':np.array(circuits['output_distribution'], dtype=float)}
+            for v in self.versions:
+                self.mean[v] = np.zeros(n_circuits)
+                self.m2[v] = np.zeros(n_circuits)
+                self.gate_count[v] = np.zeros(n_circuits, dtype=np.int64)
+        elif list(circuits['circuit_desc']) != self.circuits['circuit_desc'] \
+             or list(circuits['input_state']) != self.circuits['input_state']:
+            raise ValueError('The runs are not of the circuits of the aggregator')
+    
+    # Adding n runs of mean mean and sum of squared deviations m2 to the version
+    def combine(self, version, n, mean, m2):
+        n_total = self.n_runs[version] + n
+        delta = mean - self.mean[version]
+        self.m2[version] = self.m2[version] + m2 + delta**2*self.n_runs[version]*n/n_total
+        self.mean[version] = self.mean[version] + delta*n/n_total
+        self.n_runs[version] = n_total
+    
+    def add(self, analysed):
+        analysed = gather_stat_dist(analysed)
+        self.init_circuits(analysed)
+        version = analysed['version']
+        self.gate_count[version] = np.array(analysed['gate_count'], dtype=np.int64)
         
-        for r in bare_runs:
-            bare_mean_stat_dist += r['stat_dist']/len(bare_runs)
-            
-        for r in encoded_runs:
-            encoded_mean_stat_dist += r['stat_dist']/len(encoded_runs)
-            
-        for r in bare_runs:
-            bare_std_dev += (r['stat_dist']-bare_mean_stat_dist)**2/(len(bare_runs)-1)
-        bare_std_dev = np.sqrt(bare_std_dev)
-        ct = t.interval(confidence, len(bare_runs)-1, loc=0, scale=1)[1]
-        bare_confi = ct*bare_std_dev/np.sqrt(len(bare_runs))
-            
-        for r in encoded_runs:
-            encoded_std_dev += (r['stat_dist']-encoded_mean_stat_dist)**2/(len(encoded_runs)-1)
-        encoded_std_dev = np.sqrt(encoded_std_dev)    
-        ct = t.interval(confidence, len(encoded_runs)-1, loc=0, scale=1)[1]
-        encoded_confi = ct*encoded_std_dev/np.sqrt(len(encoded_runs))
-            
-        all_expe.append({'circuit_desc':bare_runs[0]['circuit_desc'],
-                         'gate_count_bare':bare_runs[0]['gate_count'],
-                         'gate_count_encoded':encoded_runs[0]['gate_count'],
-                         'input_state':bare_runs[0]['input_state'],
-                         'output_distribution':bare_runs[0]['output_distribution'],
-                         'bare_mean_stat_dist':bare_mean_stat_dist,
-                         'encoded_mean_stat_dist':encoded_mean_stat_dist,
-                         'bare_std_dev':bare_std_dev,
-                         'encoded_std_dev':encoded_std_dev,
-                         'bare_conf_int':bare_confi,
-                         'encoded_conf_int':encoded_confi,
-                         'confidence':confidence})
-    return all_expe
+        stat_dist = np.asarray(analysed['stat_dist'], dtype=float).reshape(-1, len(self.circuits['circuit_desc']))
+        if stat_dist.shape[0] > 0:
+            mean = stat_dist.mean(axis=0)
+            self.combine(version, stat_dist.shape[0], mean, ((stat_dist-mean)**2).sum(axis=0))
+        return self
+    
+    def merge(self, other):
+        if other.circuits is None:
+            return self
+        self.init_circuits(other.circuits)
+        for v in self.versions:
+            if other.n_runs[v] > 0:
+                self.gate_count[v] = other.gate_count[v].copy()
+                self.combine(v, other.n_runs[v], other.mean[v], other.m2[v])
+        return self
+    
+    def all_expe(self, confidence):
+        statistics = {'confidence':confidence}
+        for v in self.versions:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                std_dev = np.sqrt(self.m2[v]/(self.n_runs[v]-1))
+            statistics[v+'_mean_stat_dist'] = self.mean[v]
+            statistics[v+'_std_dev'] = std_dev
+            statistics[v+'_conf_int'] = t_conf_int(self.n_runs[v], std_dev, confidence)
+        bare = dict(self.circuits, gate_count=self.gate_count['bare'])
+        encoded = dict(self.circuits, gate_count=self.gate_count['encoded'])
+        return all_expe_records(bare, encoded, statistics)
+    
+    def save(self, path):
+        if self.circuits is None:
+            raise ValueError('The aggregator has not absorbed any run yet, there is nothing to save')
+        columns = {'circuit_desc':np.array(self.circuits['circuit_desc']),
+                   'input_state':np.array(self.circuits['input_state']),
+                   'output_distribution':self.circuits['output_distribution']}
+        for v in self.versions:
+            columns['n_runs_'+v] = np.array(self.n_runs[v])
+            columns['mean_'+v] = self.mean[v]
+            columns['m2_'+v] = self.m2[v]
+            columns['gate_count_'+v] = self.gate_count[v]
+        np.savez(path, **columns)
+    
+    @classmethod
+    def load(cls, path):
+        aggregator = cls()
+        with np.load(path) as columns:
+            aggregator.init_circuits({'circuit_desc':columns['circuit_desc'].tolist(),
+                                      'input_state':columns['input_state'].tolist(),
+                                      'output_distribution':columns['output_distribution']})
+            for v in cls.versions:
+                aggregator.n_runs[v] = int(columns['n_runs_'+v])
+                aggregator.mean[v] = columns['mean_'+v]
+                aggregator.m2[v] = columns['m2_'+v]
+                aggregator.gate_count[v] = columns['gate_count_'+v]
+        return aggregator
+
+# Function drawing bootstrap replicates of the mean statistical distance of every circuit over the runs
+# binned is the (runs x circuits x 5) array of the counts of the logical labels and of the error bin of every run
+# For each replicate the runs are drawn with replacement, then the shots of every drawn run are drawn again
+# from its observed frequencies with one multinomial draw for all runs and circuits
+# Returns the (n_replicates x circuits) array of the means, computed chunk_size replicates at a time to bound the memory
+def bootstrap_mean_stat_dist(binned, output_distribution, n_replicates, rng, chunk_size=1000):
+    
+    binned = np.asarray(binned, dtype=np.int64)
+    n_runs, n_circuits = binned.shape[0:2]
+    shots = binned.sum(axis=-1)
+    # Runs without any shot are given an arbitrary distribution, they stay without any shot
+    freqs = np.where(shots[...,None] > 0, binned/np.maximum(shots, 1)[...,None], 1/binned.shape[-1])
+    expectation = np.asarray(output_distribution, dtype=float)
+    
+    means = np.empty((n_replicates, n_circuits))
+    for start in range(0, n_replicates, chunk_size):
+        size = min(chunk_size, n_replicates-start)
+        runs = rng.integers(0, n_runs, size=(size, n_runs))
+        values = rng.multinomial(shots[runs], freqs[runs])[...,0:4]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            replicate_freqs = values/values.sum(axis=-1, keepdims=True)
+        means[start:start+size] = (.5*np.abs(replicate_freqs-expectation).sum(axis=-1)).mean(axis=1)
+    return means
+
+# Function giving the logical counts and error counts of the output of analysis_all_bare_expe or analysis_all_encoded_expe,
+# or of lists (runs) of lists (circuits) of the dictionaries given by analysis_one_bare_expe or analysis_one_encoded_expe,
+# as one (runs x circuits x 5) array, the last entry being the error bin
+def binned_counts(analysed):
+    
+    if isinstance(analysed, dict):
+        return np.concatenate([analysed['values'], np.asarray(analysed['total_err'])[...,None]], axis=-1).astype(np.int64)
+    return np.array([[np.append(r['values'], r['total_err']) for r in run] for run in analysed], dtype=np.int64)
+
+# Function drawing n_replicates bootstrap replicates of the difference encoded - bare of the mean statistical distances
+def bootstrap_difference(binned_bare, binned_encoded, output_distribution, n_replicates, rng, chunk_size=1000):
+    
+    return (bootstrap_mean_stat_dist(binned_encoded, output_distribution, n_replicates, rng, chunk_size)
+            - bootstrap_mean_stat_dist(binned_bare, output_distribution, n_replicates, rng, chunk_size))
+
+# Function run in the worker processes of parallel_bootstrap_difference
+# The binned counts of both versions are read from the shared memory block name instead of being sent to the process
+def bootstrap_difference_worker(name, shape_bare, shape_encoded, output_distribution, n_replicates, seed, chunk_size):
+    
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        binned_bare = np.ndarray(shape_bare, dtype=np.int64, buffer=block.buf)
+        binned_encoded = np.ndarray(shape_encoded, dtype=np.int64, buffer=block.buf, offset=binned_bare.nbytes)
+        replicates = bootstrap_difference(binned_bare, binned_encoded, output_distribution,
+                                          n_replicates, np.random.default_rng(seed), chunk_size)
+        # The views have to be released before the block is closed
+        del binned_bare, binned_encoded
+    finally:
+        block.close()
+    return replicates
+
+# Function splitting n_replicates replicates into tasks of chunk_size replicates, each with its own seed spawned from a seed drawn with rng
+# Returns the list of the numbers of replicates and the list of the seeds of the tasks
+def bootstrap_tasks(n_replicates, rng, chunk_size=1000):
+    
+    sizes = [min(chunk_size, n_replicates-start) for start in range(0, n_replicates, chunk_size)]
+    return sizes, np.random.SeedSequence(int(rng.integers(0, 2**63))).spawn(len(sizes))
+
+# Function drawing the replicates of the tasks of bootstrap_tasks with bootstrap_difference over a pool of processes
+# The binned counts are copied once into a shared memory block to which every worker attaches
+def parallel_bootstrap_difference(binned_bare, binned_encoded, output_distribution, sizes, seeds,
+                                  chunk_size=1000, processes=None):
+    
+    binned_bare = np.ascontiguousarray(binned_bare, dtype=np.int64)
+    binned_encoded = np.ascontiguousarray(binned_encoded, dtype=np.int64)
+    
+    block = shared_memory.SharedMemory(create=True, size=max(binned_bare.nbytes+binned_encoded.nbytes, 1))
+    try:
+        shared = np.ndarray(binned_bare.size+binned_encoded.size, dtype=np.int64, buffer=block.buf)
+        shared[0:binned_bare.size] = binned_bare.ravel()
+        shared[binned_bare.size:] = binned_encoded.ravel()
+        del shared
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            replicates = list(pool.map(bootstrap_difference_worker, itertools.repeat(block.name),
+                                       itertools.repeat(binned_bare.shape), itertools.repeat(binned_encoded.shape),
+                                       itertools.repeat(np.asarray(output_distribution, dtype=float)),
+                                       sizes, seeds, itertools.repeat(chunk_size)))
+    finally:
+        block.close()
+        block.unlink()
+    return np.concatenate(replicates, axis=0)
+
+# Function computing basic bootstrap confidence intervals of the difference between the mean statistical distances
+# of the encoded and bare versions of every circuit, from the outputs of analysis_all_bare_expe and analysis_all_encoded_expe
+# or the lists of the dictionaries given by analysis_one_bare_expe and analysis_one_encoded_expe
+# The replicates of the two versions are drawn independently with bootstrap_mean_stat_dist, rng is a numpy Generator or a seed
+# The replicates are drawn by the tasks of bootstrap_tasks, one after the other when processes is 1 or spread over a pool of
+# processes otherwise (all the cores when None), so the results only depend on rng and not on the number of processes
+def bootstrap_stat_dist_difference(analysed_bare, analysed_encoded, confidence, n_replicates=10000, rng=None, chunk_size=1000,
+                                   processes=1):
+    
+    rng = np.random.default_rng(rng)
+    bare = gather_stat_dist(analysed_bare)
+    encoded = gather_stat_dist(analysed_encoded)
+    expectation = np.asarray(bare['output_distribution'], dtype=float)
+    difference = np.asarray(encoded['stat_dist']).mean(axis=0) - np.asarray(bare['stat_dist']).mean(axis=0)
+    
+    binned_bare = binned_counts(analysed_bare)
+    binned_encoded = binned_counts(analysed_encoded)
+    sizes, seeds = bootstrap_tasks(n_replicates, rng, chunk_size)
+    if processes == 1:
+        replicates = np.concatenate([bootstrap_difference(binned_bare, binned_encoded, expectation, size,
+                                                          np.random.default_rng(seed), chunk_size)
+                                     for size, seed in zip(sizes, seeds)], axis=0)
+    else:
+        replicates = parallel_bootstrap_difference(binned_bare, binned_encoded, expectation, sizes, seeds, chunk_size, processes)
+    # The statistical distance estimated from a finite number of shots is biased upwards, more for the post-selected
+    # encoded version, and redrawing the shots adds the same bias again to the replicates (see 'bias')
+    # The basic interval 2*difference - percentiles corrects for it, it is an interval on the difference of the
+    # statistical distances of the distributions sampled by the runs
+    low, high = np.percentile(replicates, [50*(1-confidence), 50*(1+confidence)], axis=0)
+    lower, upper = 2*difference - high, 2*difference - low
+    
+    return {'difference':difference,
+            'replicates':replicates,
+            'bias':replicates.mean(axis=0) - difference,
+            'lower':lower,
+            'upper':upper,
+            'confidence':confidence}
+
+# Number of runs and circuits drawn with the same seed by dirichlet_stat_dist
+dirichlet_block_size = 16
+
+# Function sampling the posterior distribution of the statistical distance of every run and circuit
+# The frequencies of the logical labels of a run have the Dirichlet posterior of parameters values + prior given its counts
+# (prior=1 for a uniform prior, .5 for the Jeffreys prior), the shots in the error bin being discarded by the post-selection
+# analysed is the output of analysis_all_bare_expe or analysis_all_encoded_expe or the corresponding lists of dictionaries
+# The Dirichlet samples are drawn as normalized gamma variables, chunk_size runs and circuits at a time to bound the memory
+# Every block of dirichlet_block_size runs and circuits draws with its own seed spawned from a seed drawn with rng, as in bootstrap_tasks,
+# so the samples only depend on rng and not on chunk_size, which is rounded up to a whole number of blocks
+# Returns the posterior mean, standard deviation and equal-tailed credible interval at the given confidence of every run and circuit,
+# and the (n_samples x runs x circuits) samples if return_samples is True
+def dirichlet_stat_dist(analysed, confidence, n_samples=1000, prior=1., rng=None, chunk_size=256, return_samples=False):
+    
+    rng = np.random.default_rng(rng)
+    alpha = binned_counts(analysed)[...,0:4] + prior
+    shape = alpha.shape[0:2]
+    expectation = np.broadcast_to(np.asarray(gather_stat_dist(analysed)['output_distribution'], dtype=float),
+                                  alpha.shape).reshape(-1,4)
+    alpha = alpha.reshape(-1,4)
+    
+    mean = np.empty(alpha.shape[0])
+    std = np.empty(alpha.shape[0])
+    lower = np.empty(alpha.shape[0])
+    upper = np.empty(alpha.shape[0])
+    samples = np.empty((n_samples, alpha.shape[0])) if return_samples else None
+    
+    block = dirichlet_block_size
+    seeds = np.random.SeedSequence(int(rng.integers(0, 2**63))).spawn(-(-alpha.shape[0]//block))
+    chunk_size = max(1, -(-chunk_size//block))*block
+    
+    for start in range(0, alpha.shape[0], chunk_size):
+        cells = slice(start, start+chunk_size)
+        freqs = np.empty((n_samples,)+alpha[cells].shape)
+        for b in range(start, min(start+chunk_size, alpha.shape[0]), block):
+            freqs[:,b-start:b-start+block] = np.random.default_rng(seeds[b//block]).standard_gamma(
+                alpha[b:b+block], size=(n_samples,)+alpha[b:b+block].shape)
+        freqs /= freqs.sum(axis=-1, keepdims=True)
+        stat_dist = .5*np.abs(freqs-expectation[cells]).sum(axis=-1)
+        mean[cells] = stat_dist.mean(axis=0)
+        std[cells] = stat_dist.std(axis=0)
+        lower[cells], upper[cells] = np.percentile(stat_dist, [50*(1-confidence), 50*(1+confidence)], axis=0)
+        if return_samples:
+            samples[:,cells] = stat_dist
+    
+    posterior = {'mean':mean.reshape(shape),
+                 'std':std.reshape(shape),
+                 'lower':lower.reshape(shape),
+                 'upper':upper.reshape(shape),
+                 'confidence':confidence}
+    if return_samples:
+        posterior['samples'] = samples.reshape((n_samples,)+shape)
+    return posterior
 
 # Plotting the difference in statistical distance between encoded and bare version for all circuits
-def plot_stat_dist(all_expe):
+# The error bars are the sum of the two t-based intervals, or the bootstrap interval if the output of
+# bootstrap_stat_dist_difference is given
+def plot_stat_dist(all_expe, bootstrap=None):
     
     ng = np.array([e['gate_count_bare'] for e in all_expe])
     sdb = np.array([e['bare_mean_stat_dist'] for e in all_expe])
@@ -404,7 +1125,12 @@ def plot_stat_dist(all_expe):
     
     fig, ax = plt.subplots();
     
-    ax.errorbar(ng, sde-sdb, yerr=cib+cie, fmt='rx', label='Difference')
+    if bootstrap is None:
+        ax.errorbar(ng, sde-sdb, yerr=cib+cie, fmt='rx', label='Difference')
+    else:
+        # The intervals are drawn as they are, even when they do not contain the observed difference
+        ax.vlines(ng, bootstrap['lower'], bootstrap['upper'], colors='r')
+        ax.plot(ng, sde-sdb, 'rx', label='Difference')
     
     ax.set_ylabel('Difference')
     ax.set_xlabel('Number of gates in the bare circuit')
@@ -0,0 +1,185 @@
+###########################################################################################
+#            Tools for storing the results of the experiments in columnar archives
+#
+#   contributor : Christophe Vuillot
+#   affiliations : JARA Institute for Quantum Information, RWTH Aachen university
+#
+###########################################################################################
+
+# An archive is a directory holding one .npy file per column, so that every column can be
+# memory-mapped with np.load(..., mmap_mode='r') instead of parsing the results as Python literals.
+#
+#   counts.npy          int32           (jobs x circuits x 32)  counts indexed by the 5-bit outcome read as an integer
+#   job_ids.npy         bytes           (jobs)                  ids of the jobs
+#   creation_dates.npy  datetime64[ms]  (jobs)                  creation dates of the jobs
+#   shots.npy           int32           (jobs)                  number of shots per circuit
+#   status.npy          bytes           (jobs)                  status of the jobs
+#   execution_ids.npy   bytes           (jobs x circuits)       execution ids of the circuits
+#   dates.npy           datetime64[ms]  (jobs x circuits)       dates of the results of the circuits
+#   qasm_hashes.npy     bytes           (jobs x circuits)       sha1 of the qasm code of the circuits
+#   qasms.json                                                  qasm code of every hash, stored once
+#   jobs.json                                                   remaining fields of every job and circuit, e.g. 'backend',
+#                                                               'usedCredits' or the 'time' of the results, so the jobs are rebuilt whole
+
+import os
+import json
+import hashlib
+import numpy as np
+
+from .Experiment_tools import counts_vector
+
+archive_columns = ['counts', 'job_ids', 'creation_dates', 'shots', 'status', 'execution_ids', 'dates', 'qasm_hashes']
+
+# Function giving the fields of a job, as returned by api.get_job, that are not stored in the columns of an archive
+def job_extra_fields(res):
+
+    circuits = []
+    for q in res['qasms']:
+        circuits.append({'circuit':{k:v for k, v in q.items() if k not in ['executionId', 'qasm', 'result']},
+                         'result':{k:v for k, v in q['result'].items() if k not in ['data', 'date']},
+                         'data':{k:v for k, v in q['result']['data'].items() if k != 'counts'}})
+    return {'job':{k:v for k, v in res.items() if k not in ['id', 'creationDate', 'shots', 'status', 'qasms']},
+            'qasms':circuits}
+
+# Function giving the hash under which a qasm code is stored
+def qasm_hash(qasm):
+    return hashlib.sha1(qasm.encode('utf-8')).hexdigest()
+
+# Function converting a date string of the API, e.g. '2017-03-10T15:57:35.143Z', to a numpy date
+def to_datetime64(date):
+    if date is None:
+        return np.datetime64('NaT', 'ms')
+    return np.datetime64(date.rstrip('Z'), 'ms')
+
+# Function converting a numpy date back to a date string of the API
+def from_datetime64(date):
+    if np.isnat(date):
+        return None
+    return np.datetime_as_string(date, unit='ms')+'Z'
+
+# Function that converts a list of jobs, as returned by api.get_job or stored in RawDatafromPaper.py, into an archive
+def convert_results_to_archive(results_list, path):
+
+    n_jobs = len(results_list)
+    n_circuits = len(results_list[0]['qasms']) if n_jobs > 0 else 0
+    if any(len(res['qasms']) != n_circuits for res in results_list):
+        raise ValueError('All the jobs of an archive must contain the same number of circuits')
+
+    counts = np.zeros((n_jobs, n_circuits, 32), dtype=np.int32)
+    execution_ids = []
+    dates = np.empty((n_jobs, n_circuits), dtype='datetime64[ms]')
+    hashes = []
+    qasms = {}
+
+    for j, res in enumerate(results_list):
+        for k, q in enumerate(res['qasms']):
+            counts[j,k] = counts_vector(q['result']['data']['counts'])
+            dates[j,k] = to_datetime64(q['result'].get('date'))
+            execution_ids.append(q.get('executionId', ''))
+            h = qasm_hash(q['qasm'])
+            qasms[h] = q['qasm']
+            hashes.append(h)
+
+    columns = {'counts':counts,
+               'job_ids':np.array([res['id'] for res in results_list], dtype='S'),
+               'creation_dates':np.array([to_datetime64(res.get('creationDate')) for res in results_list],
+                                         dtype='datetime64[ms]'),
+               'shots':np.array([res.get('shots', 0) for res in results_list], dtype=np.int32),
+               'status':np.array([res.get('status', '') for res in results_list], dtype='S'),
+               'execution_ids':np.array(execution_ids, dtype='S').reshape(n_jobs, n_circuits),
+               'dates':dates,
+               'qasm_hashes':np.array(hashes, dtype='S').reshape(n_jobs, n_circuits)}
+
+    os.makedirs(path, exist_ok=True)
+    for name in archive_columns:
+        np.save(os.path.join(path, name+'.npy'), columns[name])
+    with open(os.path.join(path, 'qasms.json'), 'w') as f:
+        json.dump(qasms, f)
+    with open(os.path.join(path, 'jobs.json'), 'w') as f:
+        json.dump([job_extra_fields(res) for res in results_list], f)
+
+# Function loading an archive, the columns are memory-mapped unless mmap is False
+# Archives written before jobs.json existed are loaded without the remaining fields of the jobs
+def load_archive(path, mmap=True):
+
+    archive = {name:np.load(os.path.join(path, name+'.npy'), mmap_mode='r' if mmap else None)
+               for name in archive_columns}
+    with open(os.path.join(path, 'qasms.json'), 'r') as f:
+        archive['qasms'] = json.load(f)
+    archive['jobs'] = None
+    if os.path.exists(os.path.join(path, 'jobs.json')):
+        with open(os.path.join(path, 'jobs.json'), 'r') as f:
+            archive['jobs'] = json.load(f)
+    return archive
+
+# Function rebuilding one job of an archive in the format returned by api.get_job
+def archived_job(archive, j):
+
+    counts = np.asarray(archive['counts'][j])
+    extra = archive.get('jobs')
+    extra = extra[j] if extra is not None else {'job':{}, 'qasms':[{'circuit':{'status':'DONE'}, 'result':{}, 'data':{}}]*counts.shape[0]}
+    qasms = []
+    for k in range(0, counts.shape[0]):
+        nonzero = np.flatnonzero(counts[k])
+        e = extra['qasms'][k]
+        qasms.append(dict(e['circuit'],
+                          executionId=archive['execution_ids'][j,k].decode(),
+                          qasm=archive['qasms'][archive['qasm_hashes'][j,k].decode()],
+                          result=dict(e['result'],
+                                      data=dict(e['data'], counts={format(o, '05b'):int(counts[k,o]) for o in nonzero}),
+                                      date=from_datetime64(archive['dates'][j,k]))))
+
+    return dict(extra['job'],
+                id=archive['job_ids'][j].decode(),
+                creationDate=from_datetime64(archive['creation_dates'][j]),
+                shots=int(archive['shots'][j]),
+                status=archive['status'][j].decode(),
+                qasms=qasms)
+
+# Read-only list of the jobs of an archive, each job being rebuilt only when accessed
+# It can be used in place of raw_results_bare and raw_results_encoded, and the counts
+# are also directly available as a (jobs x circuits x 32) array for analysis_all_bare_expe and analysis_all_encoded_expe
+class ArchivedResults:
+
+    def __init__(self, archive):
+        if isinstance(archive, str):
+            archive = load_archive(archive)
+        self.archive = archive
+        self.counts = archive['counts']
+
+    def __len__(self):
+        return self.archive['job_ids'].shape[0]
+
+    def __getitem__(self, j):
+        if isinstance(j, slice):
+            return [archived_job(self.archive, i) for i in range(*j.indices(len(self)))]
+        if j < 0:
+            j += len(self)
+        if not 0 <= j < len(self):
+            raise IndexError('job index out of range')
+        return archived_job(self.archive, j)
+
+    def __iter__(self):
+        for j in range(0, len(self)):
+            yield archived_job(self.archive, j)
+
+# Generator going through the circuits of all the jobs of one or several archives one at a time,
+# yielding (job_id, circuit_index, counts) with counts the dictionary of the counts of the circuit,
+# or the array of 32 counts indexed by the outcome if vectors is True
+# Only one job of each memory-mapped archive is read at a time so memory does not grow with the number of jobs
+def iterate_archive(archives, vectors=False):
+
+    if isinstance(archives, (str, dict)):
+        archives = [archives]
+
+    for archive in archives:
+        if isinstance(archive, str):
+            archive = load_archive(archive)
+        for j in range(0, archive['job_ids'].shape[0]):
+            job_id = archive['job_ids'][j].decode()
+            counts = np.array(archive['counts'][j])
+            for k in range(0, counts.shape[0]):
+                if vectors:
+                    yield job_id, k, counts[k]
+                else:
+                    yield job_id, k, {format(o, '05b'):int(counts[k,o]) for o in np.flatnonzero(counts[k])}
@@ -0,0 +1,267 @@
+###########################################################################################
+#            Tools for running and fetching the jobs of the experiment
+#
+#   contributor : Christophe Vuillot
+#   affiliations : JARA Institute for Quantum Information, RWTH Aachen university
+#
+###########################################################################################
+
+# The functions only use the methods run_job and get_job of the api object, so that any
+# object providing them, e.g. a local stand-in of IBMQuantumExperience, can be used.
+
+import os
+import json
+import hashlib
+import threading
+import asyncio
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# Function reading a file of experiment ids such as data/real_bare_experiment_ids.txt
+# Each line holds one job id, optionally followed by a comma and the index of the chosen pair of qubits
+# Returns the list of ids and the list of indices of the pairs (None when absent)
+def read_experiment_ids(filename):
+
+    ids = []
+    cps = []
+    with open(filename, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line == '':
+                continue
+            fields = line.split(',')
+            ids.append(fields[0])
+            cps.append(int(fields[1]) if len(fields) > 1 else None)
+    return ids, cps
+
+# Function fetching many jobs concurrently with at most max_workers requests at the same time
+# The results are returned in the same order as the ids
+def fetch_jobs(api, ids, max_workers=8):
+
+    if len(ids) == 0:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(ids))) as pool:
+        return list(pool.map(api.get_job, ids))
+
+# Function fetching all the jobs whose ids are stored in a file of experiment ids
+# Returns the list of jobs in the order of the file together with the indices of the pairs of qubits
+def fetch_experiment_ids(api, filename, max_workers=8):
+
+    ids, cps = read_experiment_ids(filename)
+    return fetch_jobs(api, ids, max_workers), cps
+
+# Status of the jobs whose results will not change anymore and can be cached
+finished_status = ['COMPLETED', 'DONE']
+
+# Cache on disk of the jobs in front of the api, it can be used in place of the api object
+# Finished jobs are stored in directory as one json file per job, named by the sha1 of the job id,
+# later calls of get_job for them do not go through the network
+# Unseen or still running jobs are fetched from the api
+# When the files take more than max_size bytes the least recently used ones are removed
+# The size of the files is scanned once and then kept up to date, the directory is only scanned again to evict files
+class JobCache:
+
+    def __init__(self, api, directory='data/job_cache', max_size=500*2**20):
+        self.api = api
+        self.directory = directory
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(size for _, size, _ in self.entries())
+
+    # List of (modification time, size, path) of the files of the cache
+    def entries(self):
+        entries = []
+        for e in os.scandir(self.directory):
+            if e.name.endswith('.json'):
+                try:
+                    st = e.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, e.path))
+        return entries
+
+    def path(self, job_id):
+        return os.path.join(self.directory, hashlib.sha1(job_id.encode('utf-8')).hexdigest()+'.json')
+
+    def get_job(self, job_id):
+        path = self.path(job_id)
+        try:
+            with open(path, 'r') as f:
+                job = json.load(f)
+        except (FileNotFoundError, ValueError):
+            job = None
+
+        if job is not None:
+            # Marking the job as recently used for the eviction
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+            return job
+
+        job = self.api.get_job(job_id)
+        if job.get('status') in finished_status:
+            self.store(job_id, job)
+        return job
+
+    def run_job(self, *args, **kwargs):
+        return self.api.run_job(*args, **kwargs)
+
+    def store(self, job_id, job):
+        path = self.path(job_id)
+        tmp_path = path+'.'+str(threading.get_ident())+'.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(job, f)
+        size = os.path.getsize(tmp_path)
+        with self.lock:
+            try:
+                size -= os.path.getsize(path)
+            except FileNotFoundError:
+                pass
+            os.replace(tmp_path, path)
+            self.size += size
+            full = self.size > self.max_size
+        if full:
+            self.evict()
+
+    # Removing the least recently used jobs until the cache fits in max_size bytes
+    def evict(self):
+        with self.lock:
+            entries = self.entries()
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_size:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+            self.size = total
+
+    def clear(self):
+        with self.lock:
+            for e in os.scandir(self.directory):
+                if e.name.endswith('.json'):
+                    os.remove(e.path)
+            self.size = 0
+
+# Function packing a batch of circuits, e.g. qasm_batch_bare, so that each distinct qasm code is sent only once
+# A code appearing m times in the batch is sent once with m times the number of shots, stored in the field 'shots' of the circuit
+# Only an api honouring the shots of each circuit, such as LocalSimulatorApi, can run a packed batch:
+# IBMQuantumExperience.run_job takes one number of shots for the whole job, and unpack_job then raises an error
+# Returns the packed batch and the layout, i.e. the index in the packed batch of each circuit of the batch
+def pack_qasm_batch(qasm_batch, shots):
+
+    index = {}
+    packed = []
+    layout = []
+    for q in qasm_batch:
+        h = hashlib.sha1(q['qasm'].encode('utf-8')).hexdigest()
+        if h not in index:
+            index[h] = len(packed)
+            packed.append(dict(q, shots=0))
+        packed[index[h]]['shots'] += shots
+        layout.append(index[h])
+    return packed, layout
+
+# Function splitting counts {outcome:count} into m parts with as equal numbers of shots as possible
+# The shots are drawn without replacement so each part is distributed as the counts of a run of its own
+def split_counts(counts, m, rng):
+
+    outcomes = list(counts.keys())
+    remaining = np.array([counts[o] for o in outcomes], dtype=np.int64)
+    total = int(remaining.sum())
+    parts = []
+    for k in range(0, m):
+        part = rng.multivariate_hypergeometric(remaining, total//m + (1 if k < total % m else 0))
+        remaining -= part
+        parts.append({o:int(c) for o, c in zip(outcomes, part) if c > 0})
+    return parts
+
+# Function expanding a finished job of a packed batch back to the layout of the original batch given by pack_qasm_batch,
+# so that it can be analysed as the job of the original batch, shots being the number of shots of each circuit of the batch
+# The counts of a code sent once for m circuits are split between them with split_counts
+# Raises a ValueError if the counts of a code do not sum to m times shots, i.e. if the api did not honour the shots of the circuits
+def unpack_job(job, layout, shots, rng=None):
+
+    rng = np.random.default_rng(rng)
+    parts = {}
+    for i in set(layout):
+        counts = job['qasms'][i]['result']['data']['counts']
+        m = layout.count(i)
+        if sum(counts.values()) != m*shots:
+            raise ValueError('Circuit '+str(i)+' of job '+str(job.get('id'))+' ran '+str(sum(counts.values()))+' shots instead of '
+                             +str(m*shots)+', the api does not honour the shots of each circuit of a packed batch')
+        parts[i] = split_counts(counts, m, rng)
+
+    qasms = []
+    for i in layout:
+        q = job['qasms'][i]
+        result = dict(q['result'], data=dict(q['result']['data'], counts=parts[i].pop(0)))
+        qasms.append(dict(q, result=result))
+    return dict(job, qasms=qasms)
+
+# Coroutine calling a blocking method of the api in a thread, with at most as many concurrent calls as the semaphore allows
+async def api_call(semaphore, method, *args, **kwargs):
+
+    async with semaphore:
+        return await asyncio.get_event_loop().run_in_executor(None, partial(method, *args, **kwargs))
+
+# Coroutine submitting one job and polling it until it is not running anymore
+# The delay between two polls starts at min_delay and is multiplied by backoff after each poll, up to max_delay
+async def run_and_wait_job(api, semaphore, qasm_batch, device, shots, max_credits,
+                           min_delay=1, max_delay=30, backoff=1.5, on_submit=None):
+
+    out = await api_call(semaphore, api.run_job, qasm_batch, device=device, shots=shots, max_credits=max_credits)
+    if on_submit is not None:
+        on_submit(out['id'])
+
+    delay = min_delay
+    job = await api_call(semaphore, api.get_job, out['id'])
+    while job['status'] == 'RUNNING':
+        await asyncio.sleep(delay)
+        delay = min(delay*backoff, max_delay)
+        job = await api_call(semaphore, api.get_job, out['id'])
+    return job
+
+# Asynchronous generator running several batches of circuits at the same time
+# batches is a dictionary {name:(qasm_batch, number of runs)}, e.g. {'bare':(qasm_batch_bare, N_bare)}
+# on_submit(name, job_id) is called as soon as a job has been submitted, e.g. to store its id
+# When pack is True each distinct qasm code of a batch is sent only once (see pack_qasm_batch)
+# and the jobs are expanded back to the layout of the batch before being yielded
+# This needs an api honouring the shots of each circuit, such as LocalSimulatorApi, not IBMQuantumExperience
+# Yields (name, run index, job) as soon as each job is finished so its analysis can start right away
+async def run_all_jobs(api, batches, device='real', shots=8192, max_credits=5,
+                       min_delay=1, max_delay=30, backoff=1.5, on_submit=None, max_requests=8, pack=False):
+
+    semaphore = asyncio.Semaphore(max_requests)
+
+    async def run_one(name, k, qasm_batch):
+        callback = None if on_submit is None else partial(on_submit, name)
+        if pack:
+            qasm_batch, layout = pack_qasm_batch(qasm_batch, shots)
+        job = await run_and_wait_job(api, semaphore, qasm_batch, device, shots, max_credits,
+                                     min_delay, max_delay, backoff, callback)
+        if pack and job.get('status') in finished_status:
+            job = unpack_job(job, layout, shots)
+        return name, k, job
+
+    tasks = [asyncio.ensure_future(run_one(name, k, qasm_batch))
+             for name, (qasm_batch, n_runs) in batches.items() for k in range(0, n_runs)]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
+
+# Coroutine running several batches of circuits at the same time and returning {name:list of jobs in submission order}
+async def collect_all_jobs(api, batches, **kwargs):
+
+    results = {name:[None]*n_runs for name, (qasm_batch, n_runs) in batches.items()}
+    async for name, k, job in run_all_jobs(api, batches, **kwargs):
+        results[name][k] = job
+    return results
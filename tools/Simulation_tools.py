@@ -0,0 +1,523 @@
+###########################################################################################
+#            Tools for simulating the circuits of the experiment locally
+#
+#   contributor : Christophe Vuillot
+#   affiliations : JARA Institute for Quantum Information, RWTH Aachen university
+#
+###########################################################################################
+
+import uuid
+import time
+import itertools
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from .Experiment_tools import counts_vector, ir_opcodes, qasm_to_ir
+
+# Matrices of the single-qubit gates used in the qasm codes of the experiment
+gate_matrices = {'x':np.array([[0,1],[1,0]], dtype=complex),
+                 'z':np.array([[1,0],[0,-1]], dtype=complex),
+                 'h':np.array([[1,1],[1,-1]], dtype=complex)/np.sqrt(2),
+                 's':np.array([[1,0],[0,1j]], dtype=complex)}
+
+# Function giving the number of qubits, the number of bits, the list of gates (name, qubits)
+# and the list of measurements (qubit, bit) of a circuit given by its IR (see create_all_circuits)
+# Only measurements at the end of the circuit are supported
+def ir_program(ir):
+
+    gates = []
+    measures = []
+    measured = set()
+    for op, q0, q1 in zip(ir['op'].tolist(), ir['q0'].tolist(), ir['q1'].tolist()):
+        name = ir_opcodes[op]
+        if name == 'measure':
+            measures.append((q0, q1))
+            measured.add(q0)
+        elif name != 'barrier':
+            qubits = (q0, q1) if name == 'cx' else (q0,)
+            if measured.intersection(qubits):
+                raise ValueError('Gates after a measurement are not supported : '+name)
+            gates.append((name, qubits))
+    return ir['n_qubits'], ir['n_bits'], gates, measures
+
+# Function giving the same description as ir_program for a qasm code, using the memoized parser qasm_to_ir
+def parse_qasm(qasm):
+    return ir_program(qasm_to_ir(qasm))
+
+# Function describing a circuit given either by its qasm code or by its IR, so the simulators accept both
+def circuit_program(circuit):
+    if isinstance(circuit, str):
+        return parse_qasm(circuit)
+    return ir_program(circuit)
+
+# Function giving the IR of a circuit (qasm code or IR) in which every qubit is measured into the bit of the same index
+# The device filed the counts of the archived jobs under the index of the measured qubit,
+# whatever classical bit the qasm code writes to, so archived codes are simulated through this IR
+def measure_by_qubit(circuit):
+
+    ir = qasm_to_ir(circuit) if isinstance(circuit, str) else circuit
+    measure = ir['op'] == ir_opcodes.index('measure')
+    q1 = np.where(measure, ir['q0'], ir['q1']).astype(ir['q1'].dtype)
+    q1.flags.writeable = False
+    return dict(ir, n_bits=max(ir['n_bits'], ir['n_qubits']), q1=q1)
+
+# Unitary matrix of one gate on n_qubits qubits, the basis state i having qubit q equal to the bit q of i
+@lru_cache(maxsize=None)
+def gate_unitary(name, qubits, n_qubits):
+
+    dim = 2**n_qubits
+    idx = np.arange(dim)
+    unitary = np.zeros((dim,dim), dtype=complex)
+    if name == 'cx':
+        unitary[idx ^ (((idx >> qubits[0]) & 1) << qubits[1]), idx] = 1
+    else:
+        q = qubits[0]
+        for out_bit in range(0,2):
+            unitary[(idx & ~(1 << q)) | (out_bit << q), idx] += gate_matrices[name][out_bit, (idx >> q) & 1]
+    unitary.flags.writeable = False
+    return unitary
+
+# Function computing the exact probabilities of all the outcomes of a list of circuits (qasm codes or IR)
+# All the circuits are run together: at each step the circuits applying the same gate are updated at once
+# Returns an array (circuits x 2^bits) indexed by the outcome read as an integer, c[0] being the lowest bit
+def simulate_probabilities(qasms):
+
+    parsed = [circuit_program(q) for q in qasms]
+    n_qubits = max(p[0] for p in parsed)
+    n_bits = max(p[1] for p in parsed)
+
+    states = np.zeros((len(parsed), 2**n_qubits), dtype=complex)
+    states[:,0] = 1
+
+    for step in range(0, max([len(p[2]) for p in parsed]+[0])):
+        groups = {}
+        for b, p in enumerate(parsed):
+            if step < len(p[2]):
+                groups.setdefault(p[2][step], []).append(b)
+        for (name, qubits), batch in groups.items():
+            states[batch] = states[batch] @ gate_unitary(name, qubits, n_qubits).T
+
+    probabilities = np.abs(states)**2
+
+    # Sending each basis state to the outcome written in the classical register
+    idx = np.arange(2**n_qubits)
+    outcomes = np.zeros((len(parsed), 2**n_bits))
+    for b, p in enumerate(parsed):
+        outcome = np.zeros(2**n_qubits, dtype=np.int64)
+        for q, c in p[3]:
+            outcome |= ((idx >> q) & 1) << c
+        outcomes[b] = np.bincount(outcome, weights=probabilities[b], minlength=2**n_bits)
+    return outcomes
+
+# Function drawing the counts of runs runs of shots shots from the probabilities of the outcomes
+# probabilities has shape (circuits x outcomes) and the counts have shape (runs x circuits x outcomes),
+# which is the format used by analysis_all_bare_expe and analysis_all_encoded_expe
+def sample_counts(probabilities, shots, runs=1, rng=None):
+
+    if rng is None or isinstance(rng, (int, np.integer)):
+        rng = np.random.default_rng(rng)
+    probabilities = np.asarray(probabilities, dtype=float)
+    probabilities = probabilities/probabilities.sum(axis=-1, keepdims=True)
+    return rng.multinomial(shots, probabilities, size=(runs,)+probabilities.shape[:-1])
+
+# Function simulating the ideal probabilities of the circuits of archived jobs, e.g. raw_results_bare,
+# from the qasm code they actually executed, identical codes being parsed and simulated only once
+# with the outcomes filed by measured qubit as in the counts of the jobs (see measure_by_qubit)
+# Returns an array (jobs x circuits x 2^bits) to be compared with the counts of the jobs
+def archived_probabilities(results_list, simulator=simulate_probabilities):
+
+    qasms = [[q['qasm'] for q in res['qasms']] for res in results_list]
+    unique = list(dict.fromkeys(q for job in qasms for q in job))
+    index = {q:i for i, q in enumerate(unique)}
+    return simulator([measure_by_qubit(q) for q in unique])[np.array([[index[q] for q in job] for job in qasms])]
+
+# Function converting an array of counts indexed by the outcome into the dictionary of counts given by the api
+def counts_dict(counts, n_bits=5):
+    return {format(o, '0'+str(n_bits)+'b'):int(counts[o]) for o in np.flatnonzero(counts)}
+
+# Stabilizer tableau simulator (Aaronson-Gottesman) for the Clifford circuits of the experiment
+# The tableau of n qubits has 2n rows, the destabilizers 0..n-1 and the stabilizers n..2n-1,
+# their X and Z parts are packed 64 qubits per word so each gate is a few word operations on all rows.
+# The phase of each row is kept as an affine function of the random measurement outcomes:
+# r[i,0] is the constant part and r[i,1+v] the coefficient of the v-th random outcome.
+# After one pass over the circuit every measured bit is then an affine function of independent
+# uniformly random bits, from which any number of shots can be drawn at once.
+
+# Function creating the tableau of |0...0> on n_qubits qubits with room for n_variables random outcomes
+def tableau_initial(n_qubits, n_variables):
+
+    words = (n_qubits+63)//64
+    x = np.zeros((2*n_qubits, words), dtype=np.uint64)
+    z = np.zeros((2*n_qubits, words), dtype=np.uint64)
+    for q in range(0, n_qubits):
+        w, b = tableau_position(q)
+        x[q,w] |= np.uint64(1) << b
+        z[n_qubits+q,w] |= np.uint64(1) << b
+    r = np.zeros((2*n_qubits, 1+n_variables), dtype=np.uint8)
+    return {'n':n_qubits, 'x':x, 'z':z, 'r':r}
+
+# Word and bit of a qubit in the packed rows
+def tableau_position(q):
+    return q//64, np.uint64(q%64)
+
+# Function counting the bits set in each row of an array of packed words
+def popcount(words):
+    return np.unpackbits(np.ascontiguousarray(words).view(np.uint8), axis=-1).sum(axis=-1, dtype=np.int64)
+
+# Function telling for each target row if multiplying it on the left by the source Pauli adds a -1 phase,
+# this is the function g of Aaronson-Gottesman summed over all qubits with bitwise operations
+def product_phase(x1, z1, x2, z2):
+
+    plus = (x1 & ~z1 & x2 & z2) | (x1 & z1 & z2 & ~x2) | (~x1 & z1 & x2 & ~z2)
+    minus = (x1 & ~z1 & ~x2 & z2) | (x1 & z1 & x2 & ~z2) | (~x1 & z1 & x2 & z2)
+    return ((popcount(plus) - popcount(minus)) % 4 == 2).astype(np.uint8)
+
+# Function applying one gate of the qasm subset to the tableau
+def tableau_gate(tableau, name, qubits):
+
+    x, z, r = tableau['x'], tableau['z'], tableau['r']
+    one = np.uint64(1)
+    wa, ba = tableau_position(qubits[0])
+    xa = (x[:,wa] >> ba) & one
+    za = (z[:,wa] >> ba) & one
+
+    if name == 'x':
+        r[:,0] ^= za.astype(np.uint8)
+    elif name == 'z':
+        r[:,0] ^= xa.astype(np.uint8)
+    elif name == 'h':
+        r[:,0] ^= (xa & za).astype(np.uint8)
+        d = (xa ^ za) << ba
+        x[:,wa] ^= d
+        z[:,wa] ^= d
+    elif name == 's':
+        r[:,0] ^= (xa & za).astype(np.uint8)
+        z[:,wa] ^= xa << ba
+    elif name == 'cx':
+        wt, bt = tableau_position(qubits[1])
+        xt = (x[:,wt] >> bt) & one
+        zt = (z[:,wt] >> bt) & one
+        r[:,0] ^= (xa & zt & (xt ^ za ^ one)).astype(np.uint8)
+        x[:,wt] ^= xa << bt
+        z[:,wa] ^= zt << ba
+    else:
+        raise ValueError('Unsupported gate for the tableau simulator : '+name)
+
+# Function measuring one qubit of the tableau in the Z basis
+# A random outcome is the new variable variable, returns the outcome as an affine function of the variables
+def tableau_measure(tableau, q, variable):
+
+    n, x, z, r = tableau['n'], tableau['x'], tableau['z'], tableau['r']
+    w, b = tableau_position(q)
+    xq = ((x[:,w] >> b) & np.uint64(1)).astype(bool)
+    anticommuting = np.flatnonzero(xq[n:])
+
+    if len(anticommuting) > 0:
+        # Random outcome: the first anticommuting stabilizer p is replaced by +-Z_q
+        p = n + anticommuting[0]
+        targets = np.flatnonzero(xq)
+        targets = targets[targets != p]
+        r[targets,0] ^= product_phase(x[p], z[p], x[targets], z[targets])
+        r[targets] ^= r[p]
+        x[targets] ^= x[p]
+        z[targets] ^= z[p]
+        x[p-n], z[p-n], r[p-n] = x[p], z[p], r[p]
+        x[p] = 0
+        z[p] = 0
+        z[p,w] = np.uint64(1) << b
+        r[p] = 0
+        r[p,1+variable] = 1
+        return r[p].copy()
+
+    # Deterministic outcome: product of the stabilizers whose destabilizer anticommutes with Z_q
+    sx = np.zeros(x.shape[1], dtype=np.uint64)
+    sz = np.zeros(z.shape[1], dtype=np.uint64)
+    sr = np.zeros(r.shape[1], dtype=np.uint8)
+    for i in np.flatnonzero(xq[:n]):
+        sr ^= r[n+i]
+        sr[0] ^= product_phase(x[n+i], z[n+i], sx[None], sz[None])[0]
+        sx ^= x[n+i]
+        sz ^= z[n+i]
+    return sr
+
+# Function running one circuit with the tableau simulator
+# Returns an array (bits x (1+measurements)) giving each classical bit as an affine function of uniformly random bits
+def tableau_outcome_map(qasm):
+
+    n_qubits, n_bits, gates, measures = circuit_program(qasm)
+    tableau = tableau_initial(n_qubits, len(measures))
+    for name, qubits in gates:
+        tableau_gate(tableau, name, qubits)
+    outcome_map = np.zeros((n_bits, 1+len(measures)), dtype=np.uint8)
+    for v, (q, c) in enumerate(measures):
+        outcome_map[c] = tableau_measure(tableau, q, v)
+    return outcome_map
+
+# Function drawing shots of one circuit with the tableau simulator, returns the bits of each shot (shots x bits)
+def tableau_sample(qasm, shots, rng=None):
+
+    if rng is None or isinstance(rng, (int, np.integer)):
+        rng = np.random.default_rng(rng)
+    outcome_map = tableau_outcome_map(qasm)
+    variables = rng.integers(0, 2, size=(shots, outcome_map.shape[1]-1), dtype=np.int32)
+    return ((variables @ outcome_map[:,1:].T.astype(np.int32) + outcome_map[:,0]) & 1).astype(np.uint8)
+
+# Function computing the exact probabilities of the outcomes of a list of circuits with the tableau simulator,
+# in the same format as simulate_probabilities (only for a small number of bits)
+# The outcomes are uniformly distributed over an affine subspace given by tableau_outcome_map
+def tableau_probabilities(qasms):
+
+    outcome_maps = [tableau_outcome_map(q) for q in qasms]
+    n_bits = max(m.shape[0] for m in outcome_maps)
+    weights = np.uint64(1) << np.arange(n_bits, dtype=np.uint64)
+    probabilities = np.zeros((len(outcome_maps), 2**n_bits))
+
+    for k, m in enumerate(outcome_maps):
+        columns = (m.astype(np.uint64)*weights[:m.shape[0],None]).sum(axis=0)
+        # Basis of the span of the random parts
+        basis = []
+        for c in columns[1:]:
+            c = int(c)
+            for e in basis:
+                c = min(c, c ^ e)
+            if c:
+                basis.append(c)
+        outcomes = np.array([int(columns[0])], dtype=np.int64)
+        for e in basis:
+            outcomes = np.concatenate([outcomes, outcomes ^ e])
+        probabilities[k, outcomes] = 1/len(outcomes)
+    return probabilities
+
+# Pauli-frame sampler for noisy versions of the Clifford circuits
+# Each shot carries a Pauli frame, the X and Z parts of the frames of each qubit being packed 64 shots per word.
+# Random Pauli errors are added after the gates and propagated through the following gates,
+# the noisy outcomes are then the outcomes of a noiseless shot flipped by the X part of the frames.
+# The noise model is parameterized by
+#   p1 : probability of a depolarizing error (X, Y or Z) after each single-qubit gate
+#   p2 : probability of a two-qubit depolarizing error (one of the 15 non-trivial Paulis) after each cx
+#   pm : probability of flipping each measured bit
+
+# Function flipping the given shots in an array of packed words
+def flip_shots(words, shots):
+    shots = shots.astype(np.uint64)
+    np.bitwise_xor.at(words, (shots >> np.uint64(6)).astype(np.int64), np.uint64(1) << (shots & np.uint64(63)))
+
+# Function unpacking the bits of the first shots shots of an array of packed words
+def unpack_shots(words, shots):
+    return np.unpackbits(words.astype('<u8').view(np.uint8), bitorder='little')[:shots]
+
+# Function drawing the shots hit by an error of probability p, only the hit shots are drawn
+def error_shots(shots, p, rng):
+    return rng.choice(shots, size=rng.binomial(shots, p), replace=False)
+
+# Function applying one gate to the Pauli frames, Pauli gates leave the frames unchanged up to a phase
+def frame_gate(fx, fz, name, qubits):
+
+    a = qubits[0]
+    if name == 'h':
+        fx[a], fz[a] = fz[a].copy(), fx[a].copy()
+    elif name == 's':
+        fz[a] ^= fx[a]
+    elif name == 'cx':
+        t = qubits[1]
+        fx[t] ^= fx[a]
+        fz[a] ^= fz[t]
+
+# Function drawing the noisy outcomes of shots shots of one circuit, returns the bits of each shot (shots x bits)
+def pauli_frame_sample(qasm, shots, p1=0, p2=0, pm=0, rng=None):
+
+    if rng is None or isinstance(rng, (int, np.integer)):
+        rng = np.random.default_rng(rng)
+    n_qubits, n_bits, gates, measures = circuit_program(qasm)
+
+    words = (shots+63)//64
+    fx = np.zeros((n_qubits, words), dtype=np.uint64)
+    fz = np.zeros((n_qubits, words), dtype=np.uint64)
+
+    for name, qubits in gates:
+        frame_gate(fx, fz, name, qubits)
+        if len(qubits) == 1 and p1 > 0:
+            hit = error_shots(shots, p1, rng)
+            pauli = rng.integers(1, 4, size=len(hit))
+            flip_shots(fx[qubits[0]], hit[(pauli & 1) > 0])
+            flip_shots(fz[qubits[0]], hit[(pauli & 2) > 0])
+        elif len(qubits) == 2 and p2 > 0:
+            hit = error_shots(shots, p2, rng)
+            pauli = rng.integers(1, 16, size=len(hit))
+            flip_shots(fx[qubits[0]], hit[(pauli & 1) > 0])
+            flip_shots(fz[qubits[0]], hit[(pauli & 2) > 0])
+            flip_shots(fx[qubits[1]], hit[(pauli & 4) > 0])
+            flip_shots(fz[qubits[1]], hit[(pauli & 8) > 0])
+
+    bits = tableau_sample(qasm, shots, rng)
+    for q, c in measures:
+        bits[:,c] ^= unpack_shots(fx[q], shots)
+        if pm > 0:
+            bits[error_shots(shots, pm, rng), c] ^= 1
+    return bits
+
+# Function drawing the noisy counts of runs runs of shots shots of a list of circuits with the Pauli-frame sampler
+# Returns an array (runs x circuits x 2^bits) in the format of sample_counts, ready for analysis_all_bare_expe and analysis_all_encoded_expe
+def pauli_frame_counts(qasms, shots, runs=1, p1=0, p2=0, pm=0, rng=None):
+
+    if rng is None or isinstance(rng, (int, np.integer)):
+        rng = np.random.default_rng(rng)
+    all_bits = [pauli_frame_sample(q, runs*shots, p1, p2, pm, rng) for q in qasms]
+    n_bits = max(b.shape[1] for b in all_bits)
+
+    counts = np.zeros((runs, len(qasms), 2**n_bits), dtype=np.int64)
+    for k, bits in enumerate(all_bits):
+        outcomes = bits.astype(np.int64) @ (1 << np.arange(bits.shape[1], dtype=np.int64))
+        outcomes += np.repeat(np.arange(runs, dtype=np.int64)*2**n_bits, shots)
+        counts[:,k] = np.bincount(outcomes, minlength=runs*2**n_bits).reshape(runs, 2**n_bits)
+    return counts
+
+# Density-matrix simulator giving the exact noisy distributions of the outcomes
+# The noise model is parameterized by
+#   p1    : probability of a depolarizing error (X, Y or Z) after each single-qubit gate
+#   p2    : probability of a two-qubit depolarizing error (one of the 15 non-trivial Paulis) after each cx
+#   gamma : amplitude damping of the qubits of each gate after the gate
+#   pm    : probability of flipping each measured bit at readout
+noise_parameters = ['p1', 'p2', 'gamma', 'pm']
+
+pauli_matrices = [np.eye(2, dtype=complex), gate_matrices['x'], np.array([[0,-1j],[1j,0]]), gate_matrices['z']]
+
+# Operator acting as matrix on the qubit q of n_qubits qubits
+def local_operator(matrix, q, n_qubits):
+    return np.kron(np.kron(np.eye(2**(n_qubits-1-q)), matrix), np.eye(2**q))
+
+# Function applying a channel given by its Kraus operators to a density matrix
+def apply_kraus(rho, kraus):
+    return sum(k @ rho @ k.conj().T for k in kraus)
+
+# Kraus operators of the noise after one gate
+@lru_cache(maxsize=None)
+def noise_kraus(qubits, n_qubits, p1, p2, gamma):
+
+    kraus = []
+    if len(qubits) == 1 and p1 > 0:
+        paulis = [local_operator(pauli_matrices[i], qubits[0], n_qubits) for i in range(0,4)]
+        kraus.append([np.sqrt(1-p1)*paulis[0]]+[np.sqrt(p1/3)*P for P in paulis[1:]])
+    if len(qubits) == 2 and p2 > 0:
+        kraus.append([np.sqrt(1-p2 if (i,j) == (0,0) else p2/15)
+                      *local_operator(pauli_matrices[i], qubits[0], n_qubits) @ local_operator(pauli_matrices[j], qubits[1], n_qubits)
+                      for i in range(0,4) for j in range(0,4)])
+    if gamma > 0:
+        for q in qubits:
+            kraus.append([local_operator(np.array([[1,0],[0,np.sqrt(1-gamma)]]), q, n_qubits),
+                          local_operator(np.array([[0,np.sqrt(gamma)],[0,0]]), q, n_qubits)])
+    return kraus
+
+# Function computing the exact noisy probabilities of the outcomes of one circuit,
+# indexed by the outcome read as an integer as in simulate_probabilities
+def density_matrix_probabilities(qasm, p1=0, p2=0, gamma=0, pm=0):
+
+    n_qubits, n_bits, gates, measures = circuit_program(qasm)
+    rho = np.zeros((2**n_qubits, 2**n_qubits), dtype=complex)
+    rho[0,0] = 1
+
+    for name, qubits in gates:
+        # The unitaries of gate_unitary use the basis ordering of local_operator, qubit q being the bit q of the index
+        unitary = gate_unitary(name, qubits, n_qubits)
+        rho = unitary @ rho @ unitary.conj().T
+        for kraus in noise_kraus(qubits, n_qubits, p1, p2, gamma):
+            rho = apply_kraus(rho, kraus)
+
+    probabilities = np.real(np.diag(rho)).clip(0)
+    idx = np.arange(2**n_qubits)
+    outcome = np.zeros(2**n_qubits, dtype=np.int64)
+    for q, c in measures:
+        outcome |= ((idx >> q) & 1) << c
+    probabilities = np.bincount(outcome, weights=probabilities, minlength=2**n_bits)
+
+    # Readout errors flip each measured bit independently
+    outcomes = np.arange(2**n_bits)
+    for c in set(c for q, c in measures):
+        probabilities = (1-pm)*probabilities + pm*probabilities[outcomes ^ (1 << c)]
+    return probabilities
+
+# Function computing the noisy probabilities of a list of circuits for one point of the parameter grid
+def density_matrix_batch(qasms, parameters):
+    return np.array([density_matrix_probabilities(q, **parameters) for q in qasms])
+
+# Function building a parameter grid as a list of dictionaries from the values of each parameter,
+# e.g. parameter_grid(p1=[0,1e-3], p2=[0,1e-2,2e-2])
+def parameter_grid(**values):
+    names = [n for n in noise_parameters if n in values]
+    return [dict(zip(names, point)) for point in itertools.product(*[values[n] for n in names])]
+
+# Function computing the noisy probabilities of a list of circuits for every point of a parameter grid,
+# the points being spread over a pool of processes
+# Returns an array (grid points x circuits x 2^bits)
+def density_matrix_grid(qasms, grid, processes=None):
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return np.array(list(pool.map(density_matrix_batch, itertools.repeat(qasms), grid)))
+
+# Function fitting the noise parameters to the results of jobs, e.g. raw_results_bare, by maximum likelihood over a parameter grid
+# The exact qasm code executed in each job is simulated, identical codes being simulated only once,
+# with the outcomes filed by measured qubit as in the counts of the jobs (see measure_by_qubit)
+# Returns the best point of the grid and the log-likelihood of every point
+def fit_noise_parameters(results_list, grid, processes=None):
+
+    counts = {}
+    for res in results_list:
+        for q in res['qasms']:
+            counts[q['qasm']] = counts.get(q['qasm'], 0) + counts_vector(q['result']['data']['counts'])
+    qasms = list(counts)
+    counts = np.array([counts[q] for q in qasms])
+
+    probabilities = density_matrix_grid([measure_by_qubit(q) for q in qasms], grid, processes)[...,0:counts.shape[-1]]
+    with np.errstate(divide='ignore'):
+        log_likelihood = (counts*np.log(np.maximum(probabilities, 1e-300))).sum(axis=(1,2))
+    return grid[int(np.argmax(log_likelihood))], log_likelihood
+
+# Function converting the bits of each shot (shots x bits) into the dictionary of counts given by the api
+def counts_dict_from_bits(bits):
+    labels, counts = np.unique(bits[:,::-1], axis=0, return_counts=True)
+    return {''.join(str(b) for b in label):int(n) for label, n in zip(labels, counts)}
+
+# Local stand-in of the api of IBMQuantumExperience running the jobs with the state-vector simulator,
+# with the tableau simulator when method is 'tableau', or with the Pauli-frame sampler when method is 'pauli_frame'
+# in which case noise is a dictionary of the error probabilities, e.g. {'p1':1e-3, 'p2':1e-2, 'pm':2e-2}
+# The jobs are finished as soon as they are submitted and have the same format as the ones of the api,
+# so they can be used with Job_tools and with the analysis functions
+class LocalSimulatorApi:
+
+    def __init__(self, seed=None, method='statevector', noise=None):
+        if method not in ['statevector', 'tableau', 'pauli_frame']:
+            raise ValueError('Unknown simulation method : '+method)
+        self.rng = np.random.default_rng(seed)
+        self.method = method
+        self.noise = {} if noise is None else noise
+        self.jobs = {}
+
+    # A circuit of qasms holding a field 'shots' is run with that number of shots instead of shots
+    def run_job(self, qasms, device='local', shots=1024, max_credits=None):
+        codes = [q['qasm'] for q in qasms]
+        circuit_shots = [q.get('shots', shots) for q in qasms]
+        if self.method == 'tableau':
+            counts = [counts_dict_from_bits(tableau_sample(code, n, self.rng)) for code, n in zip(codes, circuit_shots)]
+        elif self.method == 'pauli_frame':
+            counts = [counts_dict_from_bits(pauli_frame_sample(code, n, rng=self.rng, **self.noise))
+                      for code, n in zip(codes, circuit_shots)]
+        else:
+            probabilities = simulate_probabilities(codes)
+            n_bits = int(np.log2(probabilities.shape[-1]))
+            counts = [counts_dict(c, n_bits) for c in sample_counts(probabilities, np.array(circuit_shots), 1, self.rng)[0]]
+        date = time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime())
+        job = {'id':uuid.uuid4().hex,
+               'backend':{'name':device},
+               'creationDate':date,
+               'shots':shots,
+               'status':'COMPLETED',
+               'qasms':[{'executionId':uuid.uuid4().hex,
+                         'qasm':code,
+                         'result':{'data':{'counts':c}, 'date':date},
+                         'status':'DONE'} for code, c in zip(codes, counts)]}
+        self.jobs[job['id']] = job
+        return job
+
+    def get_job(self, job_id):
+        return self.jobs[job_id]